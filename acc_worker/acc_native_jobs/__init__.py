@@ -5,31 +5,26 @@ import uuid
 import json
 import base64
 import traceback
-import asyncio
 import threading
-from queue import Queue, Empty as QueueEmptyError
-from concurrent.futures import ThreadPoolExecutor
-from contextlib import redirect_stdout, redirect_stderr
-from celery import Celery
-from celery.signals import worker_ready
-from celery.exceptions import SoftTimeLimitExceeded, Retry as CeleryRetry
-
-from accli import AjobCliService
-from acc_worker.acc_native_jobs.merge_csv_regional_timeseries import CSVRegionalTimeseriesMergeService
-
-from acc_worker.acc_native_jobs.validate_csv_regional_timeseries import CsvRegionalTimeseriesVerificationService
-from acc_worker.k8_gateway_actions.dispatch_build_and_push import DispatchWkubeTask
-from .exceptions import WkubeRetryException
-from acc_worker.k8_gateway_actions.registries import create_default_registry_secret_resource
-from acc_worker.k8_gateway_actions.service_accounts import add_pvc_role_to_service_account
-from acc_worker.k8_gateway_actions.periodic_tasks import delete_pvc, delete_orphan_pvcs, update_stalled_jobs_status
+from celery import Celery, current_task, chord
+from celery.signals import worker_ready, task_revoked, task_failure
+from celery.worker.control import inspect_command
+from celery.exceptions import SoftTimeLimitExceeded, TimeLimitExceeded, TaskRevokedError, Retry as CeleryRetry
+
+# Task implementations pull in pandas, pyarrow, jsonschema, minio and
+# kubernetes. They are imported inside the tasks that need them so pool
+# children only load what the tasks they run actually use.
+from .exceptions import WkubeRetryException, JobUnhealthyError
+from .log_shipping import RemoteStreamWriter
+from .job_health import get_job_health_monitor, health_context
+from .admission import get_resource_admission
+from acc_worker.log_context import log_context, BoundedTextBuffer
+from acc_worker.service_clients import get_project_service, release_project_service
+from acc_worker.idempotency import TaskExecution
 
 from acc_worker.acc_native_jobs import celeryconfig
 from acc_worker.configs.Environment import get_environment_variables
 
-from kubernetes import client, config, dynamic
-from kubernetes.client import api_client
-
 env = get_environment_variables()
 
 
@@ -38,140 +33,43 @@ app = Celery('acc_native_jobs')
 app.config_from_object(celeryconfig)
 
 
-class RemoteStreamWriter(io.TextIOBase):
-    def __init__(self, project_service: AjobCliService, chunk_size=124, max_workers=20):
-        super().__init__()
-        self.project_service = project_service
-        self.buffer = ''
-        self.chunk_size = chunk_size
-        self.executor = ThreadPoolExecutor(max_workers=max_workers)
-        self.log_counter = int(time.time())
-        self.job_is_unhealthy = threading.Event()
-        self.stop_event = threading.Event()
-        self.lock = threading.RLock()
-        self.write_thread = threading.Thread(target=self._periodic_write)
-        self.write_thread.start()
-        self.flush_in_progress = False
-
-    def write(self, data):
-        if self.job_is_unhealthy.is_set():
-            self.stop_event.set()
-            with self.lock:
-                self.buffer += data
-                self.buffer += '\n **** Job is not healthy anymore **** \n'
-            self.final_flush()
-            self.executor.shutdown(wait=False, cancel_futures=True)
-            raise ValueError("Job health reported to be bad.")
-        with self.lock:
-            self.buffer += data
-
-    def _periodic_write(self):
-        while not self.stop_event.is_set():
-            self.stop_event.wait(10)
-            if not self.job_is_unhealthy.is_set():
-                self.flush()
-
-
-    def final_flush(self):
-        with self.lock:
-            chunk = self.buffer
-            self.buffer = ''
-            filename = f"celery{self.log_counter}.log"
-            self.log_counter += 1
-
-        if chunk:
-            try:
-                self._send_chunk(chunk, filename)  # Synchronous flush
-            except Exception as e:
-                print(f"[RemoteStreamWriter] Final flush failed: {e}")
-    
-    def flush(self):
-        with self.lock:
-            if self.flush_in_progress:
-                return
-
-            if not self.buffer:
-                self.flush_in_progress = True
-
-                def _health_check():
-                    try:
-                        self.check_job_health()
-                    finally:
-                        with self.lock:
-                            self.flush_in_progress = False
-
-                self.executor.submit(_health_check)
-                return
-
-            chunk = self.buffer
-            self.buffer = ''
-            filename = f"celery{self.log_counter}.log"
-            self.log_counter += 1
-            self.flush_in_progress = True
-
-        def _flush_task():
-            try:
-                self._send_chunk(chunk, filename)
-            finally:
-                with self.lock:
-                    self.flush_in_progress = False
-
-        self.executor.submit(_flush_task)
-                    
-
-    def check_job_health(self):
-        is_healthy = self.project_service.check_job_health()
-        if not is_healthy:
-            self.job_is_unhealthy.set()
-
-                
-    def _send_chunk(self, chunk, filename):
-        self._send_request(chunk, filename)
-        
-    def _send_request(self, chunk, filename):
-        is_healthy = self.project_service.add_log_file(
-                chunk.encode(),
-                filename,
-            )
-        if not is_healthy:
-            self.job_is_unhealthy.set()
-        
-    def close(self):
-        self.last_close = True
-        self.stop_event.set()
-        self.write_thread.join()
-        self.final_flush()
-        self.executor.shutdown(wait=True)        
-
 def capture_log(func):
     """Capture stdout and stderr to accelerator data repo"""
 
     def wrapper_func(*args, **kwargs):
         job_token = kwargs['job_token']    
-        project_service = AjobCliService(
-            job_token,
-            server_url=env.ACCELERATOR_CLI_BASE_URL,
-            verify_cert=False
-        )
+        project_service = get_project_service(job_token)
 
         project_service.update_job_status("PROCESSING")
 
-        log_stream = RemoteStreamWriter(project_service, chunk_size=1024)
+        log_stream = RemoteStreamWriter(project_service)
+
+        health_watch = get_job_health_monitor().watch(
+            job_token,
+            project_service,
+            on_unhealthy=[log_stream.job_is_unhealthy.set]
+        )
 
         error = None
 
-        with redirect_stdout(log_stream), redirect_stderr(log_stream):
-            try:
-                func(*args, **kwargs)
+        try:
+            with log_context(log_stream), health_context(health_watch):
+                try:
+                    func(*args, **kwargs)
 
-            except Exception as err:
-                
-                error = err
-                error_message = ''.join(traceback.format_exc())
-                log_stream.write(error_message)
+                except Exception as err:
 
-        
-        log_stream.close()
+                    error = err
+                    error_message = ''.join(traceback.format_exc())
+                    try:
+                        log_stream.write(error_message)
+                    except JobUnhealthyError:
+                        # Written and flushed, the stream only reports it
+                        pass
+        finally:
+            get_job_health_monitor().unwatch(health_watch)
+            log_stream.close()
+            release_project_service(job_token)
 
         if not error:
             project_service.update_job_status("DONE")
@@ -189,28 +87,37 @@ def wkube_capture_log(func):
         
         job_token = kwargs['job_token']    
         
-        project_service = AjobCliService(
-            job_token,
-            server_url=env.ACCELERATOR_CLI_BASE_URL,
-            verify_cert=False
-        )
+        project_service = get_project_service(job_token)
 
         project_service.update_job_status("PREPARING")
 
-        log_stream = RemoteStreamWriter(project_service, chunk_size=1024)
+        log_stream = RemoteStreamWriter(project_service)
+
+        health_watch = get_job_health_monitor().watch(
+            job_token,
+            project_service,
+            on_unhealthy=[log_stream.job_is_unhealthy.set]
+        )
 
         error = None
 
-        with redirect_stdout(log_stream), redirect_stderr(log_stream):
-            try:
-                func(*args, **kwargs)
-                
-            except Exception as err:
-                error = err
-                error_message = ''.join(traceback.format_exc())
-                log_stream.write(error_message)
+        try:
+            with log_context(log_stream), health_context(health_watch):
+                try:
+                    func(*args, **kwargs)
 
-        log_stream.close()
+                except Exception as err:
+                    error = err
+                    error_message = ''.join(traceback.format_exc())
+                    try:
+                        log_stream.write(error_message)
+                    except JobUnhealthyError:
+                        # Written and flushed, the stream only reports it
+                        pass
+        finally:
+            get_job_health_monitor().unwatch(health_watch)
+            log_stream.close()
+            release_project_service(job_token)
 
         if error:
             if not isinstance(error, CeleryRetry):
@@ -223,16 +130,55 @@ def wkube_capture_log(func):
         
     return wrapper_func
 
+def admit_resources(ram_required=4 * 1024**3, disk_required=6 * 1024**3, cores_required=1):
+    """Start the task only when its declared resources fit on this host.
+
+    Declared `ram_required`, `disk_required` and `cores_required` task
+    kwargs override the defaults. A task that does not fit within
+    ADMISSION_WAIT seconds is requeued instead of started.
+
+    Off unless ADMISSION_ENABLED is set. Reservations are only shared by
+    workers in the same container, i.e. the same pid namespace and ledger
+    file; workers in other containers on the host are not accounted for.
+    """
+
+    def decorator(func):
+
+        def wrapper_func(*args, **kwargs):
+            if not env.ADMISSION_ENABLED:
+                return func(*args, **kwargs)
+
+            admission = get_resource_admission()
+            reservation_id = admission.reserve(
+                current_task.name,
+                int(kwargs.get('ram_required', ram_required)),
+                int(kwargs.get('disk_required', disk_required)),
+                float(kwargs.get('cores_required', cores_required)),
+                wait=env.ADMISSION_WAIT
+            )
+
+            if not reservation_id:
+                print(
+                    f"Not enough free resources for {current_task.name}, "
+                    f"requeued for {env.ADMISSION_RETRY_COUNTDOWN}s."
+                )
+                raise current_task.retry(
+                    countdown=env.ADMISSION_RETRY_COUNTDOWN,
+                    max_retries=None
+                )
+
+            try:
+                return func(*args, **kwargs)
+            finally:
+                admission.release(reservation_id)
+
+        return wrapper_func
+
+    return decorator
+
+
 def handle_soft_time_limit(func):
     def wrapper_func(*args, **kwargs):
-        
-        job_token = kwargs['job_token']    
-        
-        project_service = AjobCliService(
-            job_token,
-            server_url=env.ACCELERATOR_CLI_BASE_URL,
-            verify_cert=False
-        )
         try:
             func(*args, **kwargs)
         except SoftTimeLimitExceeded:
@@ -244,27 +190,27 @@ def handle_soft_time_limit(func):
 def handle_wkube_soft_time_limit(func):
     
     def wrapper_func(*args, **kwargs):
-        
-        job_token = kwargs['job_token']    
-        
-        project_service = AjobCliService(
-            job_token,
-            server_url=env.ACCELERATOR_CLI_BASE_URL,
-            verify_cert=False
-        )
         try:
             func(*args, **kwargs)
         except SoftTimeLimitExceeded:
-            print("Building timeout")
+            print("Building timeout, resources created by the task were deleted.")
 
     return wrapper_func
 
+@inspect_command()
+def resource_reservations(state):
+    """`celery -A acc_worker.acc_native_jobs inspect resource_reservations`"""
+    return get_resource_admission().snapshot()
+
+
 @worker_ready.connect
 def at_start(sender, **k):
 
     if not env.WKUBE_SECRET_JSON_B64:
         return
 
+    from acc_worker.k8_gateway_actions.registries import create_default_registry_secret_resource
+
     create_default_registry_secret_resource()
 
     print("Default registries created.")
@@ -279,6 +225,8 @@ def clean_unused_pvcs_task():
         print("Wkube k8s secrets env var WKUBE_SECRET_JSON_B64 not set.")
         return
 
+    from acc_worker.k8_gateway_actions.periodic_tasks import delete_orphan_pvcs
+
     delete_orphan_pvcs()
     print('Unused pvcs cleaned')
 
@@ -288,6 +236,8 @@ def clean_unused_pvcs_task():
     )
 def clean_unused_pvcs_task():
 
+    from acc_worker.k8_gateway_actions.periodic_tasks import update_stalled_jobs_status
+
     update_stalled_jobs_status()
     print('Stalled jobs status updated')
 
@@ -301,19 +251,43 @@ def delete_pvc_task(pvc_name):
         print("Wkube k8s secrets env var WKUBE_SECRET_JSON_B64 not set.")
         return
 
+    from acc_worker.k8_gateway_actions.periodic_tasks import delete_pvc
+
     delete_pvc(pvc_name)
     print(f'Pvc deleted: {pvc_name}')
         
 @app.task(
         name='acc_native_jobs.verify_csv_regional_timeseries'
     )
+def verify_csv_regional_timeseries(*args, **kwargs):
+    """Validate the selected files in this task, or for large batches split
+    them into verify_csv_regional_timeseries_part subtasks whose outcomes
+    are combined by aggregate_csv_regional_timeseries_verification.
+
+    The `fan_out` kwarg forces either mode. Fan-out requires a result
+    backend (CELERY_RESULT_BACKEND) and is never used without one.
+    """
+    fan_out = kwargs.get(
+        'fan_out',
+        len(kwargs['selected_files_ids']) >= env.VALIDATION_FANOUT_MIN_FILES
+    )
+
+    if fan_out and env.CELERY_RESULT_BACKEND:
+        fan_out_csv_regional_timeseries_verification(**kwargs)
+    else:
+        verify_csv_regional_timeseries_in_one_task(*args, **kwargs)
+
+
+@admit_resources()
 @capture_log
 @handle_soft_time_limit
-def verify_csv_regional_timeseries(*args, **kwargs):
+def verify_csv_regional_timeseries_in_one_task(*args, **kwargs):
+    from acc_worker.acc_native_jobs.validate_csv_regional_timeseries import CsvRegionalTimeseriesVerificationService
 
     selected_files_ids = kwargs['selected_files_ids']
     selected_filenames = kwargs['selected_filenames']
     dataset_template_id = kwargs['dataset_template_id']
+    execution = TaskExecution(kwargs['job_token'])
 
     for index in range(len(selected_files_ids)):
         filename = selected_filenames[index]
@@ -325,18 +299,185 @@ def verify_csv_regional_timeseries(*args, **kwargs):
             bucket_object_id=bucket_object_id,
             dataset_template_id=dataset_template_id,
             job_token=kwargs.get('job_token'),
-            s3_filename=filename
+            s3_filename=filename,
+            project_service=get_project_service(kwargs['job_token'])
+        )
+        execution.run_stage(
+            f'validation_registered:{bucket_object_id}',
+            csv_regional_timeseries_verification_service
         )
-        csv_regional_timeseries_verification_service()
 
         print(f"_____________DONE: Validating file: {filename} _____________")
 
+
+def fan_out_csv_regional_timeseries_verification(**kwargs):
+    """Start the subtasks. The job stays PROCESSING until the aggregating
+    callback or, when a subtask fails, the errback sets its status."""
+    job_token = kwargs['job_token']
+    project_service = get_project_service(job_token)
+    files = list(zip(kwargs['selected_files_ids'], kwargs['selected_filenames']))
+    group_size = max(env.VALIDATION_FANOUT_GROUP_SIZE, 1)
+    file_groups = [files[i:i + group_size] for i in range(0, len(files), group_size)]
+
+    project_service.update_job_status("PROCESSING")
+
+    log_stream = RemoteStreamWriter(project_service)
+
+    error = None
+
+    try:
+        with log_context(log_stream):
+            try:
+                chord(
+                    verify_csv_regional_timeseries_part.s(
+                        job_token=job_token,
+                        dataset_template_id=kwargs['dataset_template_id'],
+                        files=file_group
+                    )
+                    for file_group in file_groups
+                )(
+                    aggregate_csv_regional_timeseries_verification.s(job_token=job_token).on_error(
+                        fail_csv_regional_timeseries_verification.s(job_token=job_token)
+                    )
+                )
+
+                print(f"Validation of {len(files)} files split into {len(file_groups)} subtasks.")
+            except Exception as err:
+                error = err
+                log_stream.write(''.join(traceback.format_exc()))
+    finally:
+        log_stream.close()
+        release_project_service(job_token)
+
+    if error:
+        project_service.update_job_status("ERROR")
+        raise error
+
+
+@app.task(
+        name='acc_native_jobs.verify_csv_regional_timeseries_part'
+    )
+@admit_resources()
+def verify_csv_regional_timeseries_part(*args, **kwargs):
+    """Validate a group of files of a fanned out validation.
+
+    Never raises for invalid files, so the aggregating callback always runs.
+    The log of each file is shipped as soon as the file is done, so users
+    can follow long validations. Returns one outcome per file.
+    """
+    from acc_worker.acc_native_jobs.validate_csv_regional_timeseries import CsvRegionalTimeseriesVerificationService
+
+    outcomes = []
+    execution = TaskExecution(kwargs['job_token'])
+    log_stream = RemoteStreamWriter(get_project_service(kwargs['job_token']))
+
+    try:
+        for bucket_object_id, filename in kwargs['files']:
+            outcomes.append(
+                verify_csv_regional_timeseries_file(
+                    CsvRegionalTimeseriesVerificationService, execution, log_stream,
+                    bucket_object_id, filename, **kwargs
+                )
+            )
+    finally:
+        log_stream.close()
+        release_project_service(kwargs['job_token'])
+
+    return outcomes
+
+
+def verify_csv_regional_timeseries_file(
+    service_class, execution, log_stream, bucket_object_id, filename, **kwargs
+):
+    # Files are validated whole, their logs do not interleave with other parts
+    log_buffer = BoundedTextBuffer()
+    is_valid = True
+
+    with log_context(log_buffer):
+        try:
+            print(f"_____________Validating file: {filename} _____________")
+
+            csv_regional_timeseries_verification_service = service_class(
+                bucket_object_id=bucket_object_id,
+                dataset_template_id=kwargs['dataset_template_id'],
+                job_token=kwargs['job_token'],
+                s3_filename=filename,
+                project_service=get_project_service(kwargs['job_token'])
+            )
+            execution.run_stage(
+                f'validation_registered:{bucket_object_id}',
+                csv_regional_timeseries_verification_service
+            )
+
+            print(f"_____________DONE: Validating file: {filename} _____________")
+        except Exception:
+            is_valid = False
+            print(''.join(traceback.format_exc()))
+
+    log_stream.write(log_buffer.getvalue())
+
+    return {
+        'bucket_object_id': bucket_object_id,
+        'filename': filename,
+        'is_valid': is_valid,
+    }
+
+
+@app.task(
+        name='acc_native_jobs.aggregate_csv_regional_timeseries_verification'
+    )
+def aggregate_csv_regional_timeseries_verification(results, **kwargs):
+    """Ship a summary of all parts and set the job status. The parts
+    shipped the logs of their files already."""
+    job_token = kwargs['job_token']
+    project_service = get_project_service(job_token)
+
+    outcomes = [outcome for part_outcomes in results for outcome in part_outcomes]
+    invalid_filenames = [outcome['filename'] for outcome in outcomes if not outcome['is_valid']]
+
+    log_stream = RemoteStreamWriter(project_service)
+
+    log_stream.write(
+        f"_____________{len(outcomes) - len(invalid_filenames)} of {len(outcomes)} files validated _____________\n"
+    )
+    for filename in invalid_filenames:
+        log_stream.write(f"Validation failed: {filename}\n")
+
+    log_stream.close()
+    release_project_service(job_token)
+
+    if invalid_filenames:
+        project_service.update_job_status("ERROR")
+    else:
+        project_service.update_job_status("DONE")
+
+
+@app.task(
+        name='acc_native_jobs.fail_csv_regional_timeseries_verification'
+    )
+def fail_csv_regional_timeseries_verification(request, exc, tb, **kwargs):
+    """Errback of a fanned out validation whose subtask raised, was killed
+    or ran out of retries, so the aggregating callback never runs."""
+    job_token = kwargs['job_token']
+    project_service = get_project_service(job_token)
+
+    log_stream = RemoteStreamWriter(project_service)
+    log_stream.write(f"_____________Validation subtask {request.id} failed: {exc!r} _____________\n")
+    log_stream.close()
+    release_project_service(job_token)
+
+    project_service.update_job_status("ERROR")
+
+
 @app.task(
         name='acc_native_jobs.merge_csv_regional_timeseries'
     )
+@admit_resources(ram_required=2 * 1024**3, disk_required=2 * 1024**3)
 @capture_log
 @handle_soft_time_limit
 def merge_csv_regional_timeseries(*args, **kwargs):
+    from acc_worker.acc_native_jobs.merge_csv_regional_timeseries import CSVRegionalTimeseriesMergeService
+
     selected_filenames = kwargs['selected_filenames']
 
     print(f"_____________Merging following files: {selected_filenames} _____________")
@@ -346,9 +487,48 @@ def merge_csv_regional_timeseries(*args, **kwargs):
     csv_regional_timeseries_merge_service = CSVRegionalTimeseriesMergeService(
         filename=merged_filename,
         bucket_object_id_list=bucket_object_id_list,
-        job_token=kwargs.get('job_token')
+        job_token=kwargs.get('job_token'),
+        streaming=kwargs.get('streaming_merge', True),
+        project_service=get_project_service(kwargs['job_token'])
+    )
+    TaskExecution(kwargs['job_token']).run_stage(
+        'merged_validation_registered',
+        csv_regional_timeseries_merge_service
     )
-    csv_regional_timeseries_merge_service()
+
+
+@app.task(
+        name='acc_native_jobs.prebuild_predefined_stacks'
+    )
+def prebuild_predefined_stacks(refresh=False):
+    """Build and push the base layers of every predefined stack, so builds
+    of jobs using a stack start from cached layers.
+
+    Stacks whose current Dockerfile was built already are skipped unless
+    `refresh` is set, which rebuilds them on fresh base images.
+    """
+    if not env.WKUBE_SECRET_JSON_B64:
+        return
+
+    from acc_worker.k8_gateway_actions.dispatch_build_and_push import (
+        OCIImageBuilder, BaseStack, PREDEFINED_STACK_SCHEME
+    )
+    from acc_worker.k8_gateway_actions.build_scheduler import BUILD_PRIORITY_PREBUILD
+
+    for stack in BaseStack:
+        try:
+            image = OCIImageBuilder()(
+                f"{PREDEFINED_STACK_SCHEME}{stack.value}",
+                "base",
+                base_stack=stack.value,
+                force_build=refresh,
+                pull_always=refresh,
+                job_name=current_task.request.id,
+                build_priority=BUILD_PRIORITY_PREBUILD,
+            )
+            print(f"Base layers of stack {stack.value}: {image}")
+        except Exception:
+            print(f"Could not prebuild stack {stack.value}: {traceback.format_exc()}")
 
 
 @app.task(
@@ -357,5 +537,55 @@ def merge_csv_regional_timeseries(*args, **kwargs):
 @wkube_capture_log
 @handle_wkube_soft_time_limit
 def dispatch_wkube_task(*args, **kwargs):
+    """Build the job image and launch the wkube job.
+
+    Cluster objects the task created (user Job, workflow and graph PVCs)
+    are deleted when it times out, is revoked or the job is reported
+    unhealthy. Other failures only delete a builder Job that did not
+    succeed. Revoke prefork workers with
+    `revoke(task_id, terminate=True, signal='SIGUSR1')` so the task can
+    clean up itself; otherwise the worker deletes them by label.
+    """
+    from acc_worker.k8_gateway_actions.dispatch_build_and_push import DispatchWkubeTask
+
     dispatch = DispatchWkubeTask(*args, **kwargs)
-    dispatch()
\ No newline at end of file
+    try:
+        dispatch()
+    except (SoftTimeLimitExceeded, TaskRevokedError, JobUnhealthyError):
+        dispatch.tear_down()
+        raise
+
+
+def delete_dispatched_resources(task_id, task_kwargs=None):
+    """Delete the objects of a killed dispatch and forget their stages, so a
+    redelivery creates them again."""
+    if not env.WKUBE_SECRET_JSON_B64:
+        return
+
+    from acc_worker.k8_gateway_actions.resource_tracker import delete_task_resources
+
+    try:
+        deleted = delete_task_resources(task_id)
+
+        job_token = (task_kwargs or {}).get('job_token')
+        if job_token:
+            execution = TaskExecution(job_token)
+            for resource in deleted:
+                if resource['stage']:
+                    execution.reset(resource['stage'])
+    except Exception:
+        print(f"Could not delete cluster resources of task {task_id}: {traceback.format_exc()}")
+
+
+@task_revoked.connect
+def tear_down_revoked_dispatch(sender=None, request=None, terminated=False, **kwargs):
+    # Only tasks that were running when revoked can have created anything.
+    if terminated and sender is not None and sender.name == dispatch_wkube_task.name:
+        delete_dispatched_resources(request.id, request.kwargs)
+
+
+@task_failure.connect(sender=dispatch_wkube_task)
+def tear_down_timed_out_dispatch(sender=None, task_id=None, exception=None, kwargs=None, **extra):
+    # The hard time limit kills the pool child before it can clean up.
+    if isinstance(exception, TimeLimitExceeded):
+        delete_dispatched_resources(task_id, kwargs)
\ No newline at end of file
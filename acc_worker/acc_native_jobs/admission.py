@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import shutil
+import threading
+from contextlib import contextmanager
+
+from acc_worker.configs.Environment import get_environment_variables
+
+env = get_environment_variables()
+
+
+def get_available_memory():
+    with open('/proc/meminfo') as meminfo:
+        values = {}
+        for line in meminfo:
+            key, value = line.split(':', 1)
+            values[key] = int(value.split()[0]) * 1024
+    return values.get('MemAvailable', values.get('MemFree', 0)), values['MemTotal']
+
+
+class ResourceAdmission:
+    """Reserve declared task resources against what the host actually has.
+
+    Reservations are kept in a small json ledger on the scratch disk,
+    guarded by a file lock, so all pool children of all workers in the
+    same container see the same state. Entries of processes that no longer
+    exist are dropped on every access. Ledger entries are keyed by pid, so
+    workers in other containers, which have their own pid namespace and
+    usually their own scratch disk, are not accounted for. Their usage only
+    shows up in the available memory and disk checked below.
+
+    A request is admitted when the declared memory fits into both the
+    currently available memory and `memory_fraction` of the total memory
+    minus existing reservations, the same for disk on `scratch_dir`, and
+    the declared cores fit into the cpu count minus reserved cores.
+    """
+
+    def __init__(
+        self,
+        ledger_path=env.ADMISSION_LEDGER_PATH,
+        scratch_dir=env.ADMISSION_SCRATCH_DIR,
+        memory_fraction=env.ADMISSION_MEMORY_FRACTION,
+        disk_fraction=env.ADMISSION_DISK_FRACTION
+    ):
+        self.ledger_path = ledger_path
+        self.scratch_dir = scratch_dir
+        self.memory_fraction = memory_fraction
+        self.disk_fraction = disk_fraction
+        self.thread_lock = threading.Lock()
+
+    @contextmanager
+    def _ledger(self):
+        os.makedirs(os.path.dirname(self.ledger_path) or '.', exist_ok=True)
+        with self.thread_lock, open(self.ledger_path, 'a+') as ledger_file:
+            fcntl.flock(ledger_file, fcntl.LOCK_EX)
+            try:
+                ledger_file.seek(0)
+                content = ledger_file.read()
+                reservations = json.loads(content) if content.strip() else {}
+                reservations = {
+                    key: value for key, value in reservations.items()
+                    if self._process_exists(value['pid'])
+                }
+
+                yield reservations
+
+                ledger_file.seek(0)
+                ledger_file.truncate()
+                ledger_file.write(json.dumps(reservations))
+                ledger_file.flush()
+            finally:
+                fcntl.flock(ledger_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _process_exists(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def _fits(self, reservations, ram, disk, cores):
+        reserved_ram = sum(item['ram'] for item in reservations.values())
+        reserved_disk = sum(item['disk'] for item in reservations.values())
+        reserved_cores = sum(item['cores'] for item in reservations.values())
+
+        available_memory, total_memory = get_available_memory()
+        disk_usage = shutil.disk_usage(self.scratch_dir)
+
+        return (
+            ram <= available_memory
+            and reserved_ram + ram <= total_memory * self.memory_fraction
+            and disk <= disk_usage.free
+            and reserved_disk + disk <= disk_usage.total * self.disk_fraction
+            and reserved_cores + cores <= (os.cpu_count() or 1)
+        )
+
+    def try_reserve(self, task_name, ram, disk, cores):
+        """Return a reservation id, or None when the request does not fit."""
+        os.makedirs(self.scratch_dir, exist_ok=True)
+
+        with self._ledger() as reservations:
+            # A single request larger than the host is admitted when nothing
+            # else runs, otherwise it could never start.
+            if reservations and not self._fits(reservations, ram, disk, cores):
+                return None
+
+            reservation_id = uuid.uuid4().hex
+            reservations[reservation_id] = {
+                'task': task_name,
+                'pid': os.getpid(),
+                'ram': ram,
+                'disk': disk,
+                'cores': cores,
+                'reserved_at': time.time(),
+            }
+            return reservation_id
+
+    def reserve(self, task_name, ram, disk, cores, wait=0, poll_interval=5):
+        """Try to reserve for up to `wait` seconds."""
+        deadline = time.monotonic() + wait
+        while True:
+            reservation_id = self.try_reserve(task_name, ram, disk, cores)
+            if reservation_id or time.monotonic() >= deadline:
+                return reservation_id
+            time.sleep(poll_interval)
+
+    def release(self, reservation_id):
+        with self._ledger() as reservations:
+            reservations.pop(reservation_id, None)
+
+    def snapshot(self):
+        with self._ledger() as reservations:
+            available_memory, total_memory = get_available_memory()
+            disk_usage = shutil.disk_usage(self.scratch_dir)
+            return {
+                'reservations': list(reservations.values()),
+                'reserved_ram': sum(item['ram'] for item in reservations.values()),
+                'reserved_disk': sum(item['disk'] for item in reservations.values()),
+                'reserved_cores': sum(item['cores'] for item in reservations.values()),
+                'available_memory': available_memory,
+                'total_memory': total_memory,
+                'free_disk': disk_usage.free,
+                'total_disk': disk_usage.total,
+                'cpu_count': os.cpu_count(),
+            }
+
+
+_resource_admission = None
+
+
+def get_resource_admission():
+    global _resource_admission
+    if _resource_admission is None:
+        _resource_admission = ResourceAdmission()
+    return _resource_admission
@@ -1,10 +1,101 @@
 from acc_worker.configs.Environment import get_environment_variables
 from celery.schedules import crontab
+from kombu import Queue
 
 env = get_environment_variables()
 
 broker_url = env.CELERY_BROKER_URL
 
+if env.CELERY_RESULT_BACKEND:
+    result_backend = env.CELERY_RESULT_BACKEND
+
+# Tasks sent without a route (e.g. by name from the accelerator) land in the
+# default queue. It is consumed by the validation profile, whose prefork pool
+# can run any task, including memory heavy validations.
+task_default_queue = 'celery'
+
+VALIDATION_QUEUE = 'acc_native_jobs.validation'
+DISPATCH_QUEUE = 'acc_native_jobs.dispatch'
+MAINTENANCE_QUEUE = 'acc_native_jobs.maintenance'
+
+# A worker started without -Q consumes all of them, as before.
+task_queues = [
+    Queue(task_default_queue),
+    Queue(VALIDATION_QUEUE),
+    Queue(DISPATCH_QUEUE),
+    Queue(MAINTENANCE_QUEUE),
+]
+
+task_routes = {
+    'acc_native_jobs.verify_csv_regional_timeseries': {'queue': VALIDATION_QUEUE},
+    'acc_native_jobs.merge_csv_regional_timeseries': {'queue': VALIDATION_QUEUE},
+    'acc_native_jobs.verify_csv_regional_timeseries_part': {'queue': VALIDATION_QUEUE},
+    # Short, I/O bound callbacks of fanned out validations
+    'acc_native_jobs.aggregate_csv_regional_timeseries_verification': {'queue': DISPATCH_QUEUE},
+    'acc_native_jobs.fail_csv_regional_timeseries_verification': {'queue': DISPATCH_QUEUE},
+    'acc_native_jobs.dispatch_wkube_task': {'queue': DISPATCH_QUEUE},
+    'acc_native_jobs.prebuild_predefined_stacks': {'queue': DISPATCH_QUEUE},
+    'acc_native_jobs.clean_unused_pvcs_task': {'queue': MAINTENANCE_QUEUE},
+    'acc_native_jobs.update_stalled_jobs_status': {'queue': MAINTENANCE_QUEUE},
+    'acc_native_jobs.delete_pvc_task': {'queue': MAINTENANCE_QUEUE},
+}
+
+# One worker per profile, see worker_profiles.py.
+# `worker` holds worker command line options, `task` holds options applied
+# to every task routed to the profile's first queue.
+# Time limits are enforced by prefork (and gevent) pools only. Dispatch
+# runs on threads as it mostly waits on the Kubernetes API and registry, and
+# enforces its soft_time_limit itself (see ClusterResourceTracker).
+# A validation that kills its worker (e.g. out of memory) is not
+# redelivered, it would kill the next worker as well.
+WORKER_PROFILES = {
+    'validation': {
+        'queues': [VALIDATION_QUEUE, task_default_queue],
+        'worker': {
+            'pool': 'prefork',
+            'concurrency': 2,
+            'prefetch_multiplier': 1,
+        },
+        'task': {
+            'acks_late': True,
+            'reject_on_worker_lost': False,
+            'soft_time_limit': 6 * 3600,
+            'time_limit': 6 * 3600 + 300,
+        },
+    },
+    'dispatch': {
+        'queues': [DISPATCH_QUEUE],
+        'worker': {
+            'pool': 'threads',
+            'concurrency': 32,
+            'prefetch_multiplier': 1,
+        },
+        'task': {
+            'acks_late': False,
+            'soft_time_limit': 3 * 3600,
+            'time_limit': 3 * 3600 + 300,
+        },
+    },
+    'maintenance': {
+        'queues': [MAINTENANCE_QUEUE],
+        'worker': {
+            'pool': 'solo',
+            'concurrency': 1,
+            'prefetch_multiplier': 1,
+        },
+        'task': {
+            'acks_late': False,
+        },
+    },
+}
+
+task_annotations = {
+    task_name: WORKER_PROFILES[profile_name]['task']
+    for task_name, route in task_routes.items()
+    for profile_name in WORKER_PROFILES
+    if route['queue'] == WORKER_PROFILES[profile_name]['queues'][0]
+}
+
 beat_schedule = {
     # Executes every Monday morning at 7:30 a.m.
     'periodic_pvc_cleanup': {
@@ -21,4 +112,23 @@ beat_schedule = {
         ),
         'args': [],
     },
-}
\ No newline at end of file
+    # Builds stacks whose Dockerfile changed, a no-op otherwise
+    'periodic_predefined_stacks_prebuild': {
+        'task': 'acc_native_jobs.prebuild_predefined_stacks',
+        'schedule': crontab(
+            minute=0,
+            hour='*/6'
+        ),
+        'args': [],
+    },
+    # Picks up updated upstream base images every Sunday night
+    'periodic_predefined_stacks_refresh': {
+        'task': 'acc_native_jobs.prebuild_predefined_stacks',
+        'schedule': crontab(
+            minute=0,
+            hour=2,
+            day_of_week='sunday'
+        ),
+        'kwargs': {'refresh': True},
+    },
+}
@@ -1,2 +1,6 @@
 class WkubeRetryException(Exception):
     pass
+
+
+class JobUnhealthyError(ValueError):
+    pass
@@ -0,0 +1,205 @@
+import os
+import sys
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+import urllib3
+
+from accli import AjobCliService
+
+from acc_worker.configs.Environment import get_environment_variables
+from acc_worker.acc_native_jobs.exceptions import JobUnhealthyError
+
+env = get_environment_variables()
+
+
+current_health_watch = contextvars.ContextVar('current_health_watch', default=None)
+
+
+class JobHealthWatch:
+    """Health state of one running task.
+
+    The poll interval grows by `backoff` after every healthy answer up to
+    `max_interval` and falls back to `min_interval` after a failed check.
+    Callbacks in `on_unhealthy` run once when the job is reported unhealthy,
+    `cancelled` is set at the same time so task code can stop cooperatively,
+    see `raise_if_job_unhealthy`.
+    """
+
+    def __init__(
+        self,
+        job_token,
+        project_service: AjobCliService,
+        min_interval=env.JOB_HEALTH_MIN_INTERVAL,
+        max_interval=env.JOB_HEALTH_MAX_INTERVAL,
+        backoff=1.5,
+        on_unhealthy=None
+    ):
+        self.job_token = job_token
+        self.project_service = project_service
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = min_interval
+        self.next_check_at = time.monotonic() + min_interval
+        self.on_unhealthy = list(on_unhealthy or [])
+        self.cancelled = threading.Event()
+
+    def is_due(self, now):
+        return not self.cancelled.is_set() and now >= self.next_check_at
+
+    def check(self):
+        try:
+            is_healthy = self.project_service.check_job_health()
+        except Exception as e:
+            print(f"[JobHealthWatch] Health check failed: {e}", file=sys.__stderr__)
+            self.record_error()
+            return
+        self.record(is_healthy)
+
+    def record(self, is_healthy):
+        if not is_healthy:
+            self.mark_unhealthy()
+            return
+        self.interval = min(self.interval * self.backoff, self.max_interval)
+        self.next_check_at = time.monotonic() + self.interval
+
+    def record_error(self):
+        self.interval = self.min_interval
+        self.next_check_at = time.monotonic() + self.interval
+
+    def mark_unhealthy(self):
+        if self.cancelled.is_set():
+            return
+        self.cancelled.set()
+        for callback in self.on_unhealthy:
+            try:
+                callback()
+            except Exception as e:
+                print(f"[JobHealthWatch] Unhealthy callback failed: {e}", file=sys.__stderr__)
+
+    def raise_if_cancelled(self):
+        if self.cancelled.is_set():
+            raise JobUnhealthyError("Job health reported to be bad.")
+
+
+class JobHealthMonitor:
+    """Poll job health of all tasks running in this worker process.
+
+    With JOB_HEALTH_BATCH_URL set, the due checks of one round are sent in a
+    single request authorized by ACCELERATOR_APP_TOKEN. The endpoint takes a
+    list of job tokens and answers with a mapping of job token to health.
+    Tokens missing from the answer, or a failed batch request, fall back to
+    one `check_job_health` call per task.
+    """
+
+    def __init__(self, batch_url=env.JOB_HEALTH_BATCH_URL, tick_interval=1):
+        self.batch_url = batch_url
+        self.tick_interval = tick_interval
+        self.watches = set()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.http_client = urllib3.PoolManager(
+            cert_reqs="CERT_NONE",
+            num_pools=4,
+            retries=urllib3.util.Retry(total=3, backoff_factor=0.5),
+            timeout=10.
+        )
+
+    def watch(self, job_token, project_service, on_unhealthy=None):
+        health_watch = JobHealthWatch(
+            job_token,
+            project_service,
+            on_unhealthy=on_unhealthy
+        )
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+            self.watches.add(health_watch)
+        return health_watch
+
+    def unwatch(self, health_watch):
+        with self.lock:
+            self.watches.discard(health_watch)
+
+    def _run(self):
+        while True:
+            time.sleep(self.tick_interval)
+            now = time.monotonic()
+            with self.lock:
+                due = [item for item in self.watches if item.is_due(now)]
+
+            if not due:
+                continue
+
+            if self.batch_url and len(due) > 1:
+                due = self._check_batch(due)
+
+            for health_watch in due:
+                health_watch.check()
+
+    def _check_batch(self, due):
+        """Check health of `due` in one request, return the unchecked ones."""
+        try:
+            res = self.http_client.request(
+                "POST",
+                self.batch_url,
+                body=json.dumps([item.job_token for item in due]),
+                headers={
+                    'Content-Type': 'application/json',
+                    'x-authorization': env.ACCELERATOR_APP_TOKEN
+                }
+            )
+            if res.status != 200:
+                raise ValueError(f"Status code {res.status}")
+            health = json.loads(res.data.decode())
+        except Exception as e:
+            print(f"[JobHealthMonitor] Batch health check failed: {e}", file=sys.__stderr__)
+            return due
+
+        unchecked = []
+        for health_watch in due:
+            if health_watch.job_token in health:
+                health_watch.record(health[health_watch.job_token])
+            else:
+                unchecked.append(health_watch)
+        return unchecked
+
+
+_job_health_monitor = None
+_job_health_monitor_pid = None
+_job_health_monitor_lock = threading.Lock()
+
+
+def get_job_health_monitor():
+    """Per-process monitor. A forked pool child gets its own instance."""
+    global _job_health_monitor, _job_health_monitor_pid
+
+    with _job_health_monitor_lock:
+        if _job_health_monitor_pid != os.getpid():
+            _job_health_monitor = JobHealthMonitor()
+            _job_health_monitor_pid = os.getpid()
+        return _job_health_monitor
+
+
+@contextmanager
+def health_context(health_watch):
+    """Make `health_watch` the one `raise_if_job_unhealthy` checks in the
+    current context."""
+    token = current_health_watch.set(health_watch)
+    try:
+        yield health_watch
+    finally:
+        current_health_watch.reset(token)
+
+
+def raise_if_job_unhealthy():
+    """Stop the task running in the current context once its job was
+    reported unhealthy. Long-running loops call this between chunks."""
+    health_watch = current_health_watch.get()
+    if health_watch is not None:
+        health_watch.raise_if_cancelled()
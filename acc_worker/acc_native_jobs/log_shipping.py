@@ -0,0 +1,464 @@
+import io
+import os
+import sys
+import gzip
+import time
+import uuid
+import threading
+from collections import deque
+
+from accli import AjobCliService
+
+from acc_worker.configs.Environment import get_environment_variables
+from acc_worker.acc_native_jobs.exceptions import JobUnhealthyError
+
+env = get_environment_variables()
+
+
+class LogShippingService:
+    """Ship the logs of all tasks running in this worker process.
+
+    A small fixed pool of threads serves registered streams round-robin.
+    A stream is handed to one thread at a time and only one of its payloads
+    is sent per turn, so `celery<counter>.log` files of a task are uploaded
+    in order while chatty tasks cannot starve quiet ones.
+    """
+
+    def __init__(self, max_workers=env.LOG_SHIPPING_WORKERS, tick_interval=1):
+        self.max_workers = max_workers
+        self.tick_interval = tick_interval
+        self.streams = set()
+        self.ready = deque()
+        self.condition = threading.Condition()
+        self.threads = []
+
+    def _start(self):
+        if self.threads:
+            return
+
+        remove_orphan_segments()
+
+        ticker = threading.Thread(target=self._tick, daemon=True)
+        ticker.start()
+        self.threads.append(ticker)
+
+        for _ in range(self.max_workers):
+            worker = threading.Thread(target=self._work, daemon=True)
+            worker.start()
+            self.threads.append(worker)
+
+    def register(self, stream):
+        with self.condition:
+            self._start()
+            self.streams.add(stream)
+
+    def unregister(self, stream):
+        with self.condition:
+            self.streams.discard(stream)
+
+    def schedule(self, stream):
+        with self.condition:
+            if stream.scheduled:
+                return
+            stream.scheduled = True
+            self.ready.append(stream)
+            self.condition.notify()
+
+    def _tick(self):
+        while True:
+            time.sleep(self.tick_interval)
+            with self.condition:
+                streams = list(self.streams)
+            now = time.monotonic()
+            for stream in streams:
+                try:
+                    stream.on_tick(now)
+                except Exception as e:
+                    print(f"[LogShippingService] Tick failed: {e}", file=sys.__stderr__)
+
+    def _work(self):
+        while True:
+            with self.condition:
+                while not self.ready:
+                    self.condition.wait()
+                stream = self.ready.popleft()
+
+            try:
+                stream.ship_next()
+            except Exception as e:
+                print(f"[LogShippingService] Shipping failed: {e}", file=sys.__stderr__)
+
+            with self.condition:
+                if stream.has_pending():
+                    self.ready.append(stream)
+                    self.condition.notify()
+                else:
+                    stream.scheduled = False
+
+
+_log_shipping_service = None
+_log_shipping_service_pid = None
+_log_shipping_service_lock = threading.Lock()
+
+
+def get_log_shipping_service():
+    """Per-process service. A forked pool child gets its own instance."""
+    global _log_shipping_service, _log_shipping_service_pid
+
+    with _log_shipping_service_lock:
+        if _log_shipping_service_pid != os.getpid():
+            _log_shipping_service = LogShippingService()
+            _log_shipping_service_pid = os.getpid()
+        return _log_shipping_service
+
+
+def remove_orphan_segments(directory=env.LOG_SPILL_DIR):
+    """Remove segments of processes that are gone. Their records cannot be
+    replayed, the job they belong to is not recorded."""
+    if not os.path.isdir(directory):
+        return
+
+    for name in os.listdir(directory):
+        if not name.endswith('.seg'):
+            continue
+        pid = name.split('-', 1)[0]
+        if pid.isdigit():
+            try:
+                os.kill(int(pid), 0)
+                continue
+            except ProcessLookupError:
+                pass
+            except PermissionError:
+                continue
+        try:
+            os.remove(os.path.join(directory, name))
+            print(f"[LogShippingService] Removed orphan log segment {name}", file=sys.__stderr__)
+        except OSError:
+            pass
+
+
+class LogSpillSegment:
+    """Append-only file of log payloads that could not be kept in memory.
+
+    Records are read back in the order they were appended. `size` counts
+    unread bytes; the read part is cut off once it makes up half of
+    `max_size`, and the file is removed once every record has been read.
+    """
+
+    def __init__(self, directory=env.LOG_SPILL_DIR, max_size=env.LOG_SPILL_MAX_SIZE):
+        # Named after the process, see remove_orphan_segments
+        self.path = os.path.join(directory, f"{os.getpid()}-{uuid.uuid4().hex}.seg")
+        self.max_size = max_size
+        self.size = 0
+        self.read_offset = 0
+        self.count = 0
+        self._file = None
+
+    def __len__(self):
+        return self.count
+
+    def has_space(self, size):
+        return self.size + size <= self.max_size
+
+    def append(self, payload, filename):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = open(self.path, 'ab+')
+
+        record = f"{filename} {len(payload)}\n".encode() + payload
+        self._file.write(record)
+        self._file.flush()
+        self.size += len(record)
+        self.count += 1
+
+    def pop(self):
+        self._file.seek(self.read_offset)
+        filename, length = self._file.readline().decode().split()
+        payload = self._file.read(int(length))
+        self.size -= self._file.tell() - self.read_offset
+        self.read_offset = self._file.tell()
+        self.count -= 1
+
+        if not self.count:
+            self.reset()
+        elif self.read_offset >= self.max_size // 2:
+            self._compact()
+
+        return payload, filename
+
+    def _compact(self):
+        """Drop records that were read already."""
+        self._file.seek(self.read_offset)
+        with open(f"{self.path}.tmp", 'wb') as compacted:
+            while True:
+                block = self._file.read(1024 * 1024)
+                if not block:
+                    break
+                compacted.write(block)
+        self._file.close()
+        os.replace(f"{self.path}.tmp", self.path)
+        self._file = open(self.path, 'ab+')
+        self.read_offset = 0
+
+    def reset(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.size = 0
+        self.read_offset = 0
+        self.count = 0
+
+
+class RemoteStreamWriter(io.TextIOBase):
+    """Ship task output to the accelerator as `celery<counter>.log` files.
+
+    Written data is kept as a list of chunks and sealed into a payload once
+    `chunk_size` is reached or every `flush_interval` seconds. Payloads are
+    sent in order by the per-process LogShippingService; failed sends are
+    retried with backoff.
+
+    At most `max_buffer_size` bytes of payloads wait in memory. When the
+    accelerator API is slow or down further payloads go to a LogSpillSegment
+    on disk and are replayed once the queue drains. If the segment is full
+    as well, writes wait up to `write_timeout` and are then dropped with a
+    note in the log, which slows down chatty tasks.
+    Payloads still queued when the task closes keep being replayed in the
+    background for up to `replay_timeout` seconds.
+
+    Job health is polled by JobHealthWatch; it sets `job_is_unhealthy`,
+    after which the next write ships the log and raises.
+    """
+
+    def __init__(
+        self,
+        project_service: AjobCliService,
+        chunk_size=env.LOG_CHUNK_SIZE,
+        flush_interval=env.LOG_FLUSH_INTERVAL,
+        max_buffer_size=env.LOG_MAX_BUFFER_SIZE,
+        compress=env.LOG_COMPRESS,
+        write_timeout=5,
+        close_timeout=60,
+        replay_timeout=env.LOG_SPILL_REPLAY_TIMEOUT,
+        shipping_service=None
+    ):
+        super().__init__()
+        self.project_service = project_service
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        self.max_buffer_size = max_buffer_size
+        self.compress = compress
+        self.write_timeout = write_timeout
+        self.close_timeout = close_timeout
+        self.replay_timeout = replay_timeout
+
+        self.chunks = []
+        self.buffered_size = 0
+        self.pending = deque()
+        self.pending_size = 0
+        self.segment = LogSpillSegment()
+        self.dropped_size = 0
+        self.scheduled = False
+        self.last_sealed_at = time.monotonic()
+        self.retry_at = 0
+        self.retry_delay = 1
+        self.closed_at = None
+
+        self.log_counter = int(time.time())
+        self.job_is_unhealthy = threading.Event()
+        self.lock = threading.RLock()
+        self.space_available = threading.Condition(self.lock)
+
+        self.shipping_service = shipping_service or get_log_shipping_service()
+        self.shipping_service.register(self)
+
+    def write(self, data):
+        if self.job_is_unhealthy.is_set():
+            with self.lock:
+                self._append(data)
+                self._append('\n **** Job is not healthy anymore **** \n')
+            self.final_flush()
+            raise JobUnhealthyError("Job health reported to be bad.")
+
+        # Larger writes could never fit into the buffer at once
+        piece_size = max(min(self.chunk_size, self.max_buffer_size), 1)
+        for start in range(0, len(data), piece_size):
+            self._write_piece(data[start:start + piece_size])
+
+        return len(data)
+
+    def _write_piece(self, data):
+        with self.lock:
+            if not self._has_space(len(data)):
+                self.space_available.wait_for(
+                    lambda: self._has_space(len(data)),
+                    timeout=self.write_timeout
+                )
+
+            if self._has_space(len(data)):
+                self._append(data)
+            else:
+                self.dropped_size += len(data)
+
+            sealed = self.buffered_size >= self.chunk_size and self._seal()
+
+        if sealed:
+            self.shipping_service.schedule(self)
+
+    def _has_space(self, size):
+        return self.buffered_size + size <= self.max_buffer_size
+
+    def _append(self, data):
+        self.chunks.append(data)
+        self.buffered_size += len(data)
+
+    def _seal(self):
+        """Queue buffered data as a payload. Caller holds the lock."""
+        self.last_sealed_at = time.monotonic()
+
+        if not self.chunks and not self.dropped_size:
+            return False
+
+        # Buffered size is an upper bound of the payload size
+        keep_in_memory = (
+            not self.segment
+            and self.pending_size + self.buffered_size <= self.max_buffer_size
+        )
+
+        if not keep_in_memory and not self.segment.has_space(self.buffered_size + 1024):
+            return False
+
+        if self.dropped_size:
+            self._append(
+                f"\n **** {self.dropped_size} characters of log output dropped, log buffer was full **** \n"
+            )
+            self.dropped_size = 0
+
+        payload = ''.join(self.chunks).encode()
+        filename = f"celery{self.log_counter}.log"
+        self.log_counter += 1
+
+        if self.compress:
+            payload = gzip.compress(payload)
+            filename = f"{filename}.gz"
+
+        self.chunks = []
+        self.buffered_size = 0
+
+        if keep_in_memory:
+            self.pending.append((payload, filename))
+            self.pending_size += len(payload)
+        else:
+            if not self.segment:
+                print(
+                    f"[RemoteStreamWriter] Log shipping is behind, spilling to {self.segment.path}",
+                    file=sys.__stderr__
+                )
+            self.segment.append(payload, filename)
+
+        self.space_available.notify_all()
+        return True
+
+    def on_tick(self, now):
+        if self.closed_at is not None:
+            self._on_closed_tick(now)
+            return
+
+        with self.lock:
+            if now - self.last_sealed_at >= self.flush_interval:
+                self._seal()
+
+        if self.has_pending():
+            self.shipping_service.schedule(self)
+
+    def _on_closed_tick(self, now):
+        if not self._has_queued():
+            self.shipping_service.unregister(self)
+        elif now - self.closed_at > self.replay_timeout:
+            with self.lock:
+                print(
+                    f"[RemoteStreamWriter] Giving up replay, {len(self.pending) + len(self.segment)} log files lost.",
+                    file=sys.__stderr__
+                )
+                self.pending.clear()
+                self.pending_size = 0
+                self.segment.reset()
+            self.shipping_service.unregister(self)
+        elif self.has_pending():
+            self.shipping_service.schedule(self)
+
+    def _has_queued(self):
+        with self.lock:
+            return bool(self.pending or self.segment)
+
+    def has_pending(self):
+        return self._has_queued() and time.monotonic() >= self.retry_at
+
+    def ship_next(self):
+        with self.lock:
+            if not self.pending:
+                if not self.segment:
+                    return
+                payload, filename = self.segment.pop()
+                self.pending.append((payload, filename))
+                self.pending_size += len(payload)
+            payload, filename = self.pending[0]
+
+        try:
+            self._send_request(payload, filename)
+        except Exception as e:
+            print(
+                f"[RemoteStreamWriter] Sending {filename} failed, retrying in {self.retry_delay}s: {e}",
+                file=sys.__stderr__
+            )
+            self.retry_at = time.monotonic() + self.retry_delay
+            self.retry_delay = min(self.retry_delay * 2, 60)
+            return
+
+        with self.lock:
+            self.retry_delay = 1
+            self.pending.popleft()
+            self.pending_size -= len(payload)
+            self.space_available.notify_all()
+
+    def final_flush(self):
+        """Ship everything written so far and wait for it to be sent."""
+        with self.lock:
+            self._seal()
+
+        self.shipping_service.schedule(self)
+
+        with self.lock:
+            drained = self.space_available.wait_for(
+                lambda: not self.pending and not self.segment,
+                timeout=self.close_timeout
+            )
+
+        return drained
+
+    def flush(self):
+        # Shipping is driven by size and time, see on_tick.
+        pass
+
+    def _send_request(self, payload, filename):
+        is_healthy = self.project_service.add_log_file(
+                payload,
+                filename,
+            )
+        if not is_healthy:
+            self.job_is_unhealthy.set()
+
+    def close(self):
+        self.last_close = True
+        drained = self.final_flush()
+
+        if drained:
+            self.shipping_service.unregister(self)
+        else:
+            # Stay registered, the service keeps replaying in the background
+            print(
+                "[RemoteStreamWriter] Logs not fully shipped on close, replaying in background.",
+                file=sys.__stderr__
+            )
+            self.closed_at = time.monotonic()
@@ -3,11 +3,17 @@ import os
 import json
 import uuid
 import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.compute as pc
 import pyarrow.parquet as pq
-from typing import Callable, TypedDict, Iterator
+from typing import Callable, TypedDict, Iterator, Optional
 from accli import AjobCliService
 from dateutil.parser import parse as parse_date
 from acc_worker.configs.Environment import get_environment_variables
+from acc_worker.service_clients import get_project_service
+from acc_worker.acc_native_jobs.pipes import BoundedPipe
+from acc_worker.acc_native_jobs.job_health import raise_if_job_unhealthy
+from acc_worker.log_context import ContextThread
 
 env = get_environment_variables()
 
@@ -18,18 +24,16 @@ class CSVRegionalTimeseriesMergeService:
         *,
         filename: str,
         bucket_object_id_list: list[int],
-        job_token
+        job_token,
+        streaming=True,
+        project_service: Optional[AjobCliService]=None,
     ):
         
         if not filename:
             raise ValueError("Filename for merged file is required.")
 
 
-        self.project_service = AjobCliService(
-            job_token,
-            server_url=env.ACCELERATOR_CLI_BASE_URL,
-            verify_cert=False
-        )
+        self.project_service = project_service or get_project_service(job_token)
 
         self.template_rules = None
 
@@ -37,6 +41,8 @@ class CSVRegionalTimeseriesMergeService:
 
         self.bucket_object_id_list = bucket_object_id_list
 
+        self.streaming = streaming
+
         self.temp_downloaded_filename = f"{uuid.uuid4().hex}.csv"
         # self.temp_merged_filename = f"{uuid.uuid4().hex}.csv"
         self.temp_dir = f"tmp_files"
@@ -81,6 +87,7 @@ class CSVRegionalTimeseriesMergeService:
 
         with open(filepath, "wb") as tmp_file:
             for data in response.stream(amt=1024 * 1024):
+                raise_if_job_unhealthy()
                 size = tmp_file.write(data)
 
         response.release_conn()
@@ -185,9 +192,209 @@ class CSVRegionalTimeseriesMergeService:
             parquet_writer.close()
 
 
+    def iter_normalized_file_stream(self, bucket_object_id, skip_header):
+        """Yield file content with line endings normalized to '\\n'.
+        The first line is dropped when `skip_header` is set.
+        """
+        print(f'Streaming file #{bucket_object_id}.')
+        response = self.project_service.get_file_stream(
+            bucket_object_id
+        )
+
+        header_skipped = not skip_header
+        pending_cr = False
+
+        try:
+            for data in response.stream(amt=1024 * 1024):
+                raise_if_job_unhealthy()
+
+                if pending_cr:
+                    data = b'\r' + data
+                    pending_cr = False
+
+                # A '\r\n' may be split across chunks
+                if data.endswith(b'\r'):
+                    data = data[:-1]
+                    pending_cr = True
+
+                data = data.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+
+                if not header_skipped:
+                    line_end = data.find(b'\n')
+                    if line_end == -1:
+                        continue
+                    data = data[line_end + 1:]
+                    header_skipped = True
+
+                if data:
+                    yield data
+
+            if pending_cr and header_skipped:
+                yield b'\n'
+        finally:
+            response.release_conn()
+
+    def produce_merged_stream(self, pipes):
+        """Write the merged content of all input files into every pipe."""
+        error = None
+        try:
+            for index, bucket_object_id in enumerate(self.bucket_object_id_list):
+                last_byte = b'\n'
+
+                for data in self.iter_normalized_file_stream(
+                    bucket_object_id,
+                    skip_header=index > 0
+                ):
+                    for pipe in pipes:
+                        pipe.put(data)
+                    last_byte = data[-1:]
+
+                if last_byte != b'\n':
+                    for pipe in pipes:
+                        pipe.put(b'\n')
+        except Exception as err:
+            error = err
+        finally:
+            for pipe in pipes:
+                pipe.close_writer(error)
+
+    def write_parquet_from_stream(self, csv_stream, parquet_filepath):
+        value_dimension = self.template_rules['root_schema_declarations']['value_dimension']
+        time_dimension = self.template_rules['root_schema_declarations']['time_dimension']
+
+        reader = pa_csv.open_csv(
+            csv_stream,
+            convert_options=pa_csv.ConvertOptions(
+                column_types={
+                    value_dimension: pa.float32(),
+                    time_dimension: pa.int32(),
+                }
+            )
+        )
+
+        parquet_writer = None
+
+        for batch in reader:
+            columns = []
+            for name, column in zip(batch.schema.names, batch.columns):
+                if name != value_dimension:
+                    column = pc.dictionary_encode(column)
+                columns.append(column)
+
+            table = pa.Table.from_arrays(columns, names=batch.schema.names)
+
+            if parquet_writer is None:
+                parquet_writer = pq.ParquetWriter(
+                    parquet_filepath,
+                    table.schema,
+                    compression='snappy'
+                )
+
+            parquet_writer.write_table(table)
+
+        if parquet_writer:
+            parquet_writer.close()
+
+    def stream_merge(self):
+        """Merge input files without a local copy of them. The merged csv is
+        uploaded while it is being downloaded and the parquet is built from
+        the same stream.
+        """
+        parquet_filepath = f"{self.temp_downloaded_filepath}.parquet"
+
+        upload_pipe = BoundedPipe(max_chunks=8)
+        parquet_pipe = BoundedPipe(max_chunks=8)
+
+        producer = ContextThread(
+            target=self.produce_merged_stream,
+            args=([upload_pipe, parquet_pipe],)
+        )
+
+        parquet_errors = []
+
+        def _write_parquet():
+            try:
+                self.write_parquet_from_stream(parquet_pipe, parquet_filepath)
+            except Exception as err:
+                parquet_errors.append(err)
+                upload_pipe.abort(err)
+            finally:
+                parquet_pipe.abort()
+
+        parquet_worker = ContextThread(target=_write_parquet)
+
+        producer.start()
+        parquet_worker.start()
+
+        try:
+            uploaded_bucket_object_id = self.project_service.add_filestream_as_job_output(
+                f"{self.output_filename}.csv",
+                upload_pipe,
+            )
+        finally:
+            upload_pipe.abort()
+            producer.join()
+            parquet_worker.join()
+
+        if parquet_errors:
+            self.delete_local_file(parquet_filepath)
+            raise parquet_errors[0]
+
+        print('Merged file streamed to storage')
+
+        try:
+            with open(parquet_filepath, "rb") as file_stream:
+                uploaded_parquet_bucket_object_id = self.project_service.add_filestream_as_validation_supporter(
+                    f"{self.output_filename}.parquet",
+                    file_stream,
+                )
+        finally:
+            self.delete_local_file(parquet_filepath)
+            print('Temporary parquet file deleted')
+
+        return uploaded_bucket_object_id, uploaded_parquet_bucket_object_id
+
+    def register_merged_validation(
+        self,
+        uploaded_bucket_object_id,
+        dataset_template_id,
+        validation_metadata,
+        uploaded_parquet_bucket_object_id
+    ):
+        # Monkey patch serializer
+        def monkey_patched_json_encoder_default(encoder, obj):
+            if isinstance(obj, set):
+                return list(obj)
+            return json.JSONEncoder.default(encoder, obj)
+
+        json.JSONEncoder.default = monkey_patched_json_encoder_default
+        # Monkey patch serializer
+
+        self.project_service.register_validation(
+            uploaded_bucket_object_id,
+            dataset_template_id,
+            validation_metadata,
+            [uploaded_parquet_bucket_object_id]
+        )
+
     def __call__(self):
         self.check_input_files()
 
+        if self.streaming:
+            validation_metadata, dataset_template_id = self.get_merged_validated_metadata()
+
+            uploaded_bucket_object_id, uploaded_parquet_bucket_object_id = self.stream_merge()
+
+            self.register_merged_validation(
+                uploaded_bucket_object_id,
+                dataset_template_id,
+                validation_metadata,
+                uploaded_parquet_bucket_object_id
+            )
+            print('Merge complete')
+            return
+
+
 
         first_downloaded_filepath = self.download_file(self.bucket_object_id_list[0])
 
@@ -233,21 +440,11 @@ class CSVRegionalTimeseriesMergeService:
                 file_stream,
             )
 
-        # Monkey patch serializer
-        def monkey_patched_json_encoder_default(encoder, obj):
-            if isinstance(obj, set):
-                return list(obj)
-            return json.JSONEncoder.default(encoder, obj)
-
-        json.JSONEncoder.default = monkey_patched_json_encoder_default
-        # Monkey patch serializer
-
-
-        self.project_service.register_validation(
+        self.register_merged_validation(
             uploaded_bucket_object_id,
             dataset_template_id,
             validation_metadata,
-            [uploaded_parquet_bucket_object_id]
+            uploaded_parquet_bucket_object_id
         )
         print('Merge complete')
 
@@ -0,0 +1,103 @@
+import io
+import threading
+from queue import Queue, Full as QueueFullError, Empty as QueueEmptyError
+
+
+class PipeClosedError(Exception):
+    pass
+
+
+class BoundedPipe(io.RawIOBase):
+    """In-memory pipe between a producer thread and a file-like consumer.
+
+    The producer calls `put` with chunks of bytes and `close_writer` once done.
+    The consumer reads it like a regular binary file. At most `max_chunks`
+    chunks are held in memory, `put` blocks while the pipe is full. After
+    `abort` both sides get PipeClosedError instead of blocking.
+    """
+
+    def __init__(self, max_chunks=8):
+        super().__init__()
+        self._queue = Queue(maxsize=max_chunks)
+        self._buffer = bytearray()
+        self._eof = False
+        self._writer_error = None
+        self._writer_closed = threading.Event()
+        self._abort_error = None
+        self._reader_closed = threading.Event()
+
+    def put(self, data):
+        while True:
+            if self._reader_closed.is_set():
+                raise PipeClosedError("Pipe reader is closed.")
+            try:
+                self._queue.put(data, timeout=1)
+                return
+            except QueueFullError:
+                continue
+
+    def close_writer(self, error=None):
+        self._writer_error = error
+        # Seen by the reader even when the sentinel cannot be queued
+        self._writer_closed.set()
+        while not self._reader_closed.is_set():
+            try:
+                self._queue.put(None, timeout=1)
+                return
+            except QueueFullError:
+                continue
+
+    def abort(self, error=None):
+        """Stop the pipe. A producer blocked in `put` and a consumer blocked
+        in `read` get PipeClosedError, chained to `error` if given."""
+        if error is not None and self._abort_error is None:
+            self._abort_error = error
+        self._reader_closed.set()
+
+    def readable(self):
+        return True
+
+    def _next_item(self):
+        while True:
+            if self._reader_closed.is_set():
+                raise PipeClosedError(
+                    f"Pipe was aborted: {self._abort_error}" if self._abort_error else "Pipe was aborted."
+                ) from self._abort_error
+            try:
+                return self._queue.get(timeout=0.5)
+            except QueueEmptyError:
+                if self._writer_closed.is_set() and self._queue.empty():
+                    return None
+
+    def _fill(self, size):
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            item = self._next_item()
+            if item is None:
+                self._eof = True
+                if self._writer_error:
+                    raise PipeClosedError(
+                        f"Pipe writer failed: {self._writer_error}"
+                    ) from self._writer_error
+            else:
+                self._buffer += item
+
+    def read(self, size=-1):
+        if size is None:
+            size = -1
+        self._fill(size)
+        if size < 0 or size >= len(self._buffer):
+            data = bytes(self._buffer)
+            self._buffer.clear()
+        else:
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self.abort()
+        super().close()
@@ -10,6 +10,8 @@ import pyarrow.parquet as pq
 from typing import Optional
 from accli import AjobCliService
 from acc_worker.configs.Environment import get_environment_variables
+from acc_worker.service_clients import get_project_service
+from acc_worker.acc_native_jobs.job_health import raise_if_job_unhealthy
 from jsonschema import validate as jsonschema_validate
 from jsonschema.exceptions import ValidationError, SchemaError
 
@@ -46,15 +48,6 @@ class CaseInsensitiveDict(dict):
     def setdefault(self, key, default=None):
         return super().setdefault(key.lower(), default)
 
-# Example usage:
-case_insensitive_dict = CaseInsensitiveDict({'A': 1, 'b': 2})
-print(case_insensitive_dict['a'])  # Output: 1
-print(case_insensitive_dict['B'])  # Output: 2
-
-case_insensitive_dict['C'] = 3
-print(case_insensitive_dict['c'])  # Output: 3
-
-
 def lower_rows(iterator):
     # return itertools.chain([next(iterator).lower()], iterator)
     for item in iterator:
@@ -72,13 +65,10 @@ class CsvRegionalTimeseriesVerificationService():
         ram_required=4 * 1024**3,
         disk_required=6 * 1024**3,
         cores_required=1,
+        project_service: Optional[AjobCliService]=None,
     ):
         
-        self.project_service = AjobCliService(
-            job_token,
-            server_url=env.ACCELERATOR_CLI_BASE_URL,
-            verify_cert=False
-        )   
+        self.project_service = project_service or get_project_service(job_token)   
 
         self.dataset_template_id = dataset_template_id
 
@@ -131,6 +121,7 @@ class CsvRegionalTimeseriesVerificationService():
 
         with open(self.temp_downloaded_filepath, "wb") as tmp_file:
             for data in response.stream(amt=1024 * 1024):
+                raise_if_job_unhealthy()
                 size = tmp_file.write(data)
 
         response.release_conn()
@@ -266,7 +257,10 @@ class CsvRegionalTimeseriesVerificationService():
                 restval='restvals'
             )
 
-            for row in reader:
+            for row_number, row in enumerate(reader):
+                if row_number % 10000 == 0:
+                    raise_if_job_unhealthy()
+
                 row.pop('restkeys', None)
                 row.pop('restvals', None)
 
@@ -0,0 +1,72 @@
+"""Start one celery worker per profile in celeryconfig.WORKER_PROFILES.
+
+Usage: python -m acc_worker.acc_native_jobs.worker_profiles [profile ...]
+
+Without arguments all profiles are started. Beat runs inside the first
+worker. The command exits when any worker exits.
+"""
+import sys
+import time
+import signal
+import subprocess
+
+from acc_worker.acc_native_jobs.celeryconfig import WORKER_PROFILES
+
+
+def worker_command(profile_name, with_beat=False, loglevel='INFO'):
+    profile = WORKER_PROFILES[profile_name]
+    options = profile['worker']
+
+    command = [
+        sys.executable, "-m", "celery",
+        "-A", "acc_worker.acc_native_jobs",
+        "worker",
+        "-n", f"{profile_name}@%h",
+        "-Q", ','.join(profile['queues']),
+        "-P", options['pool'],
+        "-c", str(options['concurrency']),
+        "--prefetch-multiplier", str(options['prefetch_multiplier']),
+        f"--loglevel={loglevel}",
+    ]
+
+    if with_beat:
+        command.append("-B")
+
+    return command
+
+
+def main(profile_names):
+    profile_names = profile_names or list(WORKER_PROFILES.keys())
+
+    processes = []
+    for index, profile_name in enumerate(profile_names):
+        command = worker_command(profile_name, with_beat=index == 0)
+        print(f"Starting worker profile '{profile_name}': {' '.join(command)}", flush=True)
+        processes.append(subprocess.Popen(command))
+
+    def _terminate(signum, frame):
+        for process in processes:
+            process.send_signal(signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, _terminate)
+    signal.signal(signal.SIGINT, _terminate)
+
+    exit_code = None
+    while exit_code is None:
+        for process in processes:
+            if process.poll() is not None:
+                exit_code = process.returncode
+                break
+        else:
+            time.sleep(1)
+
+    _terminate(signal.SIGTERM, None)
+
+    for process in processes:
+        process.wait()
+
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
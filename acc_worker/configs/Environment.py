@@ -6,6 +6,8 @@ from functools import lru_cache
 class AppSetting:
     def __init__(self):
         self.CELERY_BROKER_URL:str = os.environ['CELERY_BROKER_URL']
+        # Needed for chords, e.g. fanned out validations. Not set means no fan-out.
+        self.CELERY_RESULT_BACKEND: Optional[str] = os.environ.get('CELERY_RESULT_BACKEND', None)
         self.ACCELERATOR_CLI_BASE_URL: str = os.environ.get('ACCELERATOR_CLI_BASE_URL', 'http://default-cli-base-url/')
         self.WKUBE_AGENT_PULLER: str = os.environ.get('WKUBE_AGENT_PULLER', 'registry.iiasa.ac.at/accelerator/wkube-agent-puller:latest')
         self.IMAGE_REGISTRY_URL: str = os.environ['IMAGE_REGISTRY_URL']
@@ -13,6 +15,32 @@ class AppSetting:
         self.IMAGE_REGISTRY_TAG_PREFIX: str = os.environ.get('IMAGE_REGISTRY_TAG_PREFIX', '') 
         self.IMAGE_REGISTRY_USER: str = os.environ['IMAGE_REGISTRY_USER']
         self.IMAGE_REGISTRY_PASSWORD: str = os.environ['IMAGE_REGISTRY_PASSWORD']
+        # Seconds a found / missing image tag is cached by the registry client
+        self.IMAGE_REGISTRY_TAG_CACHE_TTL: int = int(os.environ.get('IMAGE_REGISTRY_TAG_CACHE_TTL', 300))
+        self.IMAGE_REGISTRY_NEGATIVE_CACHE_TTL: int = int(os.environ.get('IMAGE_REGISTRY_NEGATIVE_CACHE_TTL', 15))
+        # Seconds the refs of a git repo are reused for image tags
+        self.GIT_REF_CACHE_TTL: int = int(os.environ.get('GIT_REF_CACHE_TTL', 30))
+        # 'kubernetes' coordinates builds of an image tag with a Lease, 'local' only within a process
+        self.BUILD_COORDINATION: str = os.environ.get('BUILD_COORDINATION', 'kubernetes')
+        self.BUILD_LEASE_DURATION: int = int(os.environ.get('BUILD_LEASE_DURATION', 30))
+        # Seconds a builder pod may take to start and a builder Job to finish
+        self.BUILD_POD_START_TIMEOUT: int = int(os.environ.get('BUILD_POD_START_TIMEOUT', 300))
+        self.BUILD_TIMEOUT: int = int(os.environ.get('BUILD_TIMEOUT', 2 * 3600))
+        # Builder Jobs running at once in the cluster, in total and per user
+        self.BUILD_MAX_CONCURRENT: int = int(os.environ.get('BUILD_MAX_CONCURRENT', 4))
+        self.BUILD_MAX_CONCURRENT_PER_USER: int = int(os.environ.get('BUILD_MAX_CONCURRENT_PER_USER', 2))
+        self.BUILD_QUEUE_STALE_AFTER: int = int(os.environ.get('BUILD_QUEUE_STALE_AFTER', 60))
+        # Persistent buildah stores reused across builds, 0 means a fresh store per build
+        self.BUILDER_WARM_POOL_SIZE: int = int(os.environ.get('BUILDER_WARM_POOL_SIZE', 0))
+        self.BUILDER_STORAGE_SIZE: str = os.environ.get('BUILDER_STORAGE_SIZE', '50Gi')
+        self.BUILDER_STORAGE_MAX_SIZE: int = int(os.environ.get('BUILDER_STORAGE_MAX_SIZE', 40 * 1024**3))
+        self.BUILDER_STORAGE_SIZE_CHECK_INTERVAL: int = int(os.environ.get('BUILDER_STORAGE_SIZE_CHECK_INTERVAL', 6 * 3600))
+        self.BUILDER_STORAGE_MAX_AGE: int = int(os.environ.get('BUILDER_STORAGE_MAX_AGE', 14 * 24 * 3600))
+        # Limits of the build folders on a warm builder store, swept by the builds using it
+        self.BUILD_SITE_MAX_SIZE: int = int(os.environ.get('BUILD_SITE_MAX_SIZE', 20 * 1024**3))
+        self.BUILD_SITE_MAX_AGE: int = int(os.environ.get('BUILD_SITE_MAX_AGE', 24 * 3600))
+        self.BUILD_SITE_JANITOR_INTERVAL: int = int(os.environ.get('BUILD_SITE_JANITOR_INTERVAL', 600))
+        self.GIT_MIRROR_MAX_AGE: int = int(os.environ.get('GIT_MIRROR_MAX_AGE', 30 * 24 * 3600))
         self.OCI_BUILDER_IMAGE: str = os.environ.get('OCI_BUILDER_IMAGE', f"{self.IMAGE_REGISTRY_URL}/{self.IMAGE_REGISTRY_TAG_PREFIX}image-builder:latest")
         self.WKUBE_SECRET_JSON_B64: Optional[str] = os.environ.get('WKUBE_SECRET_JSON_B64', None)
         self.WKUBE_K8_NAMESPACE: str = os.environ.get('WKUBE_K8_NAMESPACE', "wkube")
@@ -24,12 +52,52 @@ class AppSetting:
         self.JOBSTORE_S3_SECRET_KEY: Optional[str] = os.environ.get('JOBSTORE_S3_SECRET_KEY', None)
         self.JOBSTORE_S3_REGION: Optional[str] = os.environ.get('JOBSTORE_S3_REGION', "eu-central-1")
         self.JOBSTORE_S3_BUCKET_NAME: Optional[str] = os.environ.get('JOBSTORE_S3_BUCKET_NAME', None)
+        # Parallel ranged reads when extracting a job archive
+        self.JOBSTORE_ZIP_FETCH_WORKERS: int = int(os.environ.get('JOBSTORE_ZIP_FETCH_WORKERS', 4))
 
         self.ACCELERATOR_APP_TOKEN: Optional[str] = os.environ.get('ACCELERATOR_APP_TOKEN', None)
 
         self.TUNNEL_GATEWAY_SSH_PRIVATE_KEY_BASE64: Optional[str] = os.environ.get('TUNNEL_GATEWAY_SSH_PRIVATE_KEY_BASE64', None)
         self.USE_HOST_NAMESPACES: bool = os.environ.get('USE_HOST_NAMESPACES', '0').lower() in ('y', 'yes', 't', 'true', 'on', '1')
 
+        # Task log shipping. Sizes are in bytes, intervals in seconds.
+        self.LOG_CHUNK_SIZE: int = int(os.environ.get('LOG_CHUNK_SIZE', 256 * 1024))
+        self.LOG_FLUSH_INTERVAL: float = float(os.environ.get('LOG_FLUSH_INTERVAL', 10))
+        self.LOG_MAX_BUFFER_SIZE: int = int(os.environ.get('LOG_MAX_BUFFER_SIZE', 16 * 1024 * 1024))
+        # Threads shared by all tasks of a worker process for log uploads
+        self.LOG_SHIPPING_WORKERS: int = int(os.environ.get('LOG_SHIPPING_WORKERS', 4))
+        self.LOG_COMPRESS: bool = os.environ.get('LOG_COMPRESS', '0').lower() in ('y', 'yes', 't', 'true', 'on', '1')
+        # Logs the accelerator API cannot take in time are spilled here, capped per task
+        self.LOG_SPILL_DIR: str = os.environ.get('LOG_SPILL_DIR', 'tmp_files/log_spill')
+        self.LOG_SPILL_MAX_SIZE: int = int(os.environ.get('LOG_SPILL_MAX_SIZE', 512 * 1024 * 1024))
+        self.LOG_SPILL_REPLAY_TIMEOUT: float = float(os.environ.get('LOG_SPILL_REPLAY_TIMEOUT', 3600))
+
+        # Job health polling interval bounds in seconds
+        self.JOB_HEALTH_MIN_INTERVAL: float = float(os.environ.get('JOB_HEALTH_MIN_INTERVAL', 5))
+        self.JOB_HEALTH_MAX_INTERVAL: float = float(os.environ.get('JOB_HEALTH_MAX_INTERVAL', 120))
+        # Optional endpoint checking health of many jobs in one request
+        self.JOB_HEALTH_BATCH_URL: Optional[str] = os.environ.get('JOB_HEALTH_BATCH_URL', None)
+
+        # Admission of native jobs against host memory and scratch disk, only
+        # accounts for workers sharing one container (pid namespace and ledger)
+        self.ADMISSION_ENABLED: bool = os.environ.get('ADMISSION_ENABLED', '0').lower() in ('y', 'yes', 't', 'true', 'on', '1')
+        self.ADMISSION_LEDGER_PATH: str = os.environ.get('ADMISSION_LEDGER_PATH', 'tmp_files/resource_reservations.json')
+        self.ADMISSION_SCRATCH_DIR: str = os.environ.get('ADMISSION_SCRATCH_DIR', 'tmp_files')
+        self.ADMISSION_MEMORY_FRACTION: float = float(os.environ.get('ADMISSION_MEMORY_FRACTION', 0.9))
+        self.ADMISSION_DISK_FRACTION: float = float(os.environ.get('ADMISSION_DISK_FRACTION', 0.9))
+        # Seconds to wait for resources before the task is requeued, and requeue delay
+        self.ADMISSION_WAIT: float = float(os.environ.get('ADMISSION_WAIT', 30))
+        self.ADMISSION_RETRY_COUNTDOWN: int = int(os.environ.get('ADMISSION_RETRY_COUNTDOWN', 60))
+
+        # Validations with at least this many files are split into subtasks of group size files
+        self.VALIDATION_FANOUT_MIN_FILES: int = int(os.environ.get('VALIDATION_FANOUT_MIN_FILES', 4))
+        self.VALIDATION_FANOUT_GROUP_SIZE: int = int(os.environ.get('VALIDATION_FANOUT_GROUP_SIZE', 1))
+
+        # Completed stages per job token, so redelivered tasks skip finished work
+        self.EXECUTION_STATE_STORE: str = os.environ.get('EXECUTION_STATE_STORE', 'acc_worker.idempotency.SqliteExecutionStateStore')
+        self.EXECUTION_STATE_PATH: str = os.environ.get('EXECUTION_STATE_PATH', 'tmp_files/execution_state.sqlite3')
+        self.EXECUTION_STATE_TTL: int = int(os.environ.get('EXECUTION_STATE_TTL', 7 * 24 * 3600))
+
 @lru_cache
 def get_environment_variables():
     settings = AppSetting()
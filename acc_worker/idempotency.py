@@ -0,0 +1,119 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import importlib
+import threading
+
+from acc_worker.configs.Environment import get_environment_variables
+
+env = get_environment_variables()
+
+
+class SqliteExecutionStateStore:
+    """Completed task stages in a sqlite file shared by all workers on a host.
+
+    Job tokens are stored hashed. Entries older than `ttl` seconds are
+    purged when the store is opened.
+
+    Any class with the same `get`, `set` and `delete` methods can be used
+    instead through EXECUTION_STATE_STORE, e.g. one backed by a shared
+    database when redeliveries may land on another host.
+    """
+
+    def __init__(self, path=env.EXECUTION_STATE_PATH, ttl=env.EXECUTION_STATE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS execution_state ("
+                "job_key TEXT, stage TEXT, value TEXT, completed_at REAL, "
+                "PRIMARY KEY (job_key, stage))"
+            )
+            connection.execute(
+                "DELETE FROM execution_state WHERE completed_at < ?",
+                (time.time() - self.ttl,)
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, job_key, stage):
+        """Return (found, value)."""
+        with self.lock, self._connect() as connection:
+            row = connection.execute(
+                "SELECT value FROM execution_state WHERE job_key = ? AND stage = ?",
+                (job_key, stage)
+            ).fetchone()
+        if row is None:
+            return False, None
+        return True, json.loads(row[0])
+
+    def set(self, job_key, stage, value):
+        with self.lock, self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO execution_state VALUES (?, ?, ?, ?)",
+                (job_key, stage, json.dumps(value), time.time())
+            )
+
+    def delete(self, job_key, stage):
+        with self.lock, self._connect() as connection:
+            connection.execute(
+                "DELETE FROM execution_state WHERE job_key = ? AND stage = ?",
+                (job_key, stage)
+            )
+
+
+_execution_state_store = None
+_execution_state_store_pid = None
+_execution_state_store_lock = threading.Lock()
+
+
+def get_execution_state_store():
+    """Per-process store of the class named by EXECUTION_STATE_STORE."""
+    global _execution_state_store, _execution_state_store_pid
+
+    with _execution_state_store_lock:
+        if _execution_state_store_pid != os.getpid():
+            module_name, class_name = env.EXECUTION_STATE_STORE.rsplit('.', 1)
+            store_class = getattr(importlib.import_module(module_name), class_name)
+            _execution_state_store = store_class()
+            _execution_state_store_pid = os.getpid()
+        return _execution_state_store
+
+
+class TaskExecution:
+    """Stages of one job that survive redelivery and retries of its task.
+
+    `run_stage` runs a stage once per job token and returns the recorded
+    (json serializable) result on later runs, so a re-run resumes at the
+    first stage that did not complete.
+    """
+
+    def __init__(self, job_token, store=None):
+        self.job_key = hashlib.sha256(job_token.encode()).hexdigest()
+        self.store = store or get_execution_state_store()
+
+    def is_completed(self, stage):
+        found, _ = self.store.get(self.job_key, stage)
+        return found
+
+    def complete(self, stage, value=None):
+        self.store.set(self.job_key, stage, value)
+
+    def reset(self, stage):
+        self.store.delete(self.job_key, stage)
+
+    def run_stage(self, stage, func, *args, **kwargs):
+        found, value = self.store.get(self.job_key, stage)
+        if found:
+            print(f"Stage '{stage}' already completed, skipping.")
+            return value
+
+        value = func(*args, **kwargs)
+        self.store.set(self.job_key, stage, value)
+        return value
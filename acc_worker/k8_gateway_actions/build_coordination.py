@@ -0,0 +1,288 @@
+import os
+import uuid
+import socket
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from datetime import datetime, timedelta, timezone
+
+from kubernetes.dynamic.exceptions import NotFoundError, ConflictError
+
+from acc_worker.configs.Environment import get_environment_variables
+from acc_worker.log_context import ContextThread
+
+env = get_environment_variables()
+
+RESULT_ANNOTATION = 'accelerator/build-result'
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _micro_time(moment):
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+class KubernetesBuildLease:
+    """A coordination.k8s.io Lease owned by the worker that runs a build.
+
+    The owner renews the lease while it builds, writes the outcome into the
+    `accelerator/build-result` annotation and deletes the lease. An expired
+    lease is taken over, e.g. after its owner was killed. Renewals, the
+    outcome and the deletion are conditional on the lease still being held
+    by this owner at the version it last saw, so a former owner never
+    touches a lease that was taken over.
+    """
+
+    def __init__(self, api_cli, name, holder, duration=env.BUILD_LEASE_DURATION, annotations=None):
+        self.api_cli = api_cli
+        self.annotations = annotations or {}
+        self.leases = api_cli.resources.get(api_version='coordination.k8s.io/v1', kind='Lease')
+        self.name = name
+        self.holder = holder
+        self.duration = duration
+        self.stop_renewing = threading.Event()
+        self.renew_thread = None
+        self.resource_version = None
+
+    def _manifest(self, resource_version=None):
+        now = _micro_time(_now())
+        metadata = {"name": self.name, "namespace": env.WKUBE_K8_NAMESPACE}
+        if resource_version:
+            metadata["resourceVersion"] = resource_version
+        if self.annotations:
+            metadata["annotations"] = self.annotations
+
+        return {
+            "apiVersion": "coordination.k8s.io/v1",
+            "kind": "Lease",
+            "metadata": metadata,
+            "spec": {
+                "holderIdentity": self.holder,
+                "leaseDurationSeconds": self.duration,
+                "acquireTime": now,
+                "renewTime": now,
+            }
+        }
+
+    def _is_expired(self, lease):
+        spec = lease.spec
+        renew_time = spec.renewTime or spec.acquireTime
+        if not renew_time:
+            return True
+        duration = spec.leaseDurationSeconds or self.duration
+        return _parse_time(renew_time) + timedelta(seconds=duration) < _now()
+
+    def try_acquire(self, may_take_over=None):
+        """`may_take_over(lease)` can veto taking over an expired lease."""
+        try:
+            lease = self.leases.create(namespace=env.WKUBE_K8_NAMESPACE, body=self._manifest())
+            self.resource_version = lease.metadata.resourceVersion
+            return True
+        except ConflictError:
+            pass
+
+        try:
+            lease = self.leases.get(name=self.name, namespace=env.WKUBE_K8_NAMESPACE)
+        except NotFoundError:
+            # Released in the meantime, the caller tries again
+            return False
+
+        if not self._is_expired(lease):
+            return False
+        if may_take_over and not may_take_over(lease):
+            return False
+
+        try:
+            lease = self.leases.replace(
+                namespace=env.WKUBE_K8_NAMESPACE,
+                body=self._manifest(lease.metadata.resourceVersion)
+            )
+            self.resource_version = lease.metadata.resourceVersion
+            print(f"Took over expired build lease {self.name}.")
+            return True
+        except (ConflictError, NotFoundError):
+            return False
+
+    def _patch_if_held(self, body):
+        """Merge-patch the lease unless it changed since this owner last
+        wrote it. Returns False when the lease was lost."""
+        try:
+            lease = self.leases.patch(
+                name=self.name,
+                namespace=env.WKUBE_K8_NAMESPACE,
+                body={**body, "metadata": {**body.get("metadata", {}), "resourceVersion": self.resource_version}},
+                content_type='application/merge-patch+json'
+            )
+        except (ConflictError, NotFoundError):
+            return False
+
+        if lease.spec.holderIdentity != self.holder:
+            return False
+        self.resource_version = lease.metadata.resourceVersion
+        return True
+
+    def _renew(self):
+        while not self.stop_renewing.wait(self.duration / 3):
+            try:
+                if not self._patch_if_held({"spec": {"renewTime": _micro_time(_now())}}):
+                    print(f"Build lease {self.name} was taken over, stopped renewing it.")
+                    return
+            except Exception as err:
+                print(f"Could not renew build lease {self.name}: {err}")
+
+    def keep_renewed(self):
+        self.renew_thread = ContextThread(target=self._renew, daemon=True)
+        self.renew_thread.start()
+
+    def release(self, result):
+        self.stop_renewing.set()
+        if self.renew_thread:
+            self.renew_thread.join()
+
+        if not self._patch_if_held({"metadata": {"annotations": {RESULT_ANNOTATION: result}}}):
+            return
+
+        try:
+            self.leases.delete(
+                name=self.name,
+                namespace=env.WKUBE_K8_NAMESPACE,
+                body={
+                    "apiVersion": "v1",
+                    "kind": "DeleteOptions",
+                    "preconditions": {"resourceVersion": self.resource_version}
+                }
+            )
+        except (ConflictError, NotFoundError):
+            pass
+
+    def wait_for_result(self, raise_if_revoked=None):
+        """Outcome published by the owner, or None when the lease is gone
+        or expired without one."""
+        while True:
+            for event in self.api_cli.watch(
+                self.leases,
+                namespace=env.WKUBE_K8_NAMESPACE,
+                name=self.name,
+                timeout=min(self.duration, 15)
+            ):
+                annotations = event['raw_object']['metadata'].get('annotations') or {}
+                if RESULT_ANNOTATION in annotations:
+                    return annotations[RESULT_ANNOTATION]
+                if event['type'] == 'DELETED':
+                    return None
+
+            if raise_if_revoked:
+                raise_if_revoked()
+
+            try:
+                lease = self.leases.get(name=self.name, namespace=env.WKUBE_K8_NAMESPACE)
+            except NotFoundError:
+                return None
+            if self._is_expired(lease):
+                return None
+
+
+class KubernetesBuildCoordinator:
+    """At most one worker of the cluster builds an image tag at a time.
+
+    The owner of the build lease runs the build, everyone else watches the
+    lease until the owner publishes the outcome. When the owner fails, e.g.
+    because its task was revoked, a waiter takes the lease over and builds
+    itself, so one task's failure does not fail the others.
+    """
+
+    def __init__(self, api_cli):
+        self.api_cli = api_cli
+
+    def run(self, name, build, raise_if_revoked=None):
+        """Return when a build of `name` succeeded, raise when it failed here."""
+        holder = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        lease = KubernetesBuildLease(self.api_cli, name, holder)
+
+        while True:
+            if lease.try_acquire():
+                lease.keep_renewed()
+                result = 'failed'
+                try:
+                    build()
+                    result = 'succeeded'
+                    return
+                finally:
+                    lease.release(result)
+
+            print(f"Build {name} is run by another worker. Waiting for it to finish...")
+            result = lease.wait_for_result(raise_if_revoked)
+
+            if result == 'succeeded':
+                print(f"Build {name} finished in another worker.")
+                return
+            print(f"Build {name} did not finish in another worker. Taking it over...")
+
+
+class LocalBuildCoordinator:
+    """In-process stand-in for KubernetesBuildCoordinator, e.g. for local
+    runs with a single worker."""
+
+    def __init__(self):
+        self.in_flight = {}
+        self.lock = threading.Lock()
+
+    def run(self, name, build, raise_if_revoked=None):
+        while True:
+            with self.lock:
+                future = self.in_flight.get(name)
+                is_owner = future is None
+                if is_owner:
+                    future = Future()
+                    self.in_flight[name] = future
+
+            if is_owner:
+                break
+
+            print(f"Build {name} is run by another task. Waiting for it to finish...")
+            if self._wait_for_result(future, raise_if_revoked):
+                return
+            print(f"Build {name} did not finish in another task. Taking it over...")
+
+        succeeded = False
+        try:
+            build()
+            succeeded = True
+        finally:
+            with self.lock:
+                self.in_flight.pop(name, None)
+            future.set_result(succeeded)
+
+    @staticmethod
+    def _wait_for_result(future, raise_if_revoked=None):
+        """Whether the owner's build succeeded, checking for revokes while waiting."""
+        while True:
+            try:
+                return future.result(timeout=15)
+            except FutureTimeoutError:
+                if raise_if_revoked:
+                    raise_if_revoked()
+
+
+_local_build_coordinator = None
+_local_build_coordinator_pid = None
+_local_build_coordinator_lock = threading.Lock()
+
+
+def get_build_coordinator(api_cli):
+    """BUILD_COORDINATION is 'kubernetes' (default) or 'local'."""
+    global _local_build_coordinator, _local_build_coordinator_pid
+
+    if env.BUILD_COORDINATION != 'local':
+        return KubernetesBuildCoordinator(api_cli)
+
+    with _local_build_coordinator_lock:
+        if _local_build_coordinator_pid != os.getpid():
+            _local_build_coordinator = LocalBuildCoordinator()
+            _local_build_coordinator_pid = os.getpid()
+        return _local_build_coordinator
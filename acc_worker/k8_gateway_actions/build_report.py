@@ -0,0 +1,135 @@
+import re
+import json
+import time
+from contextlib import contextmanager
+
+# Builder Jobs print their report on one line with this prefix, the
+# dispatching task picks it up from the streamed logs
+BUILD_REPORT_PREFIX = "WKube build report: "
+
+STEP_PATTERN = re.compile(r'^(?:\[\d+/\d+\] )?STEP \d+/\d+: (\w+)')
+COMMIT_PATTERN = re.compile(r'^(?:\[\d+/\d+\] )?COMMIT\b')
+LAYER_PATTERN = re.compile(r'^--> [0-9a-f]{6,}$')
+BLOB_PATTERN = re.compile(r'Copying blob (?:sha256:)?([0-9a-f]+)(.*)')
+
+
+class BuildReport:
+    """Phase durations and cache statistics of one image build.
+
+    Layer counts come from `buildah bud` output: a step printing
+    `--> Using cache` reused a layer, a step committing a new layer without
+    it was rebuilt. Pushed bytes are the sizes of the layers `buildah push`
+    did not find in the registry, as stored locally (uncompressed).
+    """
+
+    def __init__(self, image_tag):
+        self.image_tag = image_tag
+        self.status = 'running'
+        self.phases = {}
+        self.cached_layers = 0
+        self.built_layers = 0
+        self.remote_cache_hits = 0
+        self.layers = {}
+        self.copied_blobs = set()
+        self.skipped_blobs = set()
+        # BuildSiteJanitor usage of a warm store
+        self.build_site = None
+
+        self.step = None
+        self.step_counted = False
+
+    @contextmanager
+    def phase(self, name):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] = round(self.phases.get(name, 0) + time.monotonic() - started, 3)
+
+    def observe_build_output(self, line):
+        step = STEP_PATTERN.match(line)
+        if step:
+            self.step = step.group(1).upper()
+            self.step_counted = False
+            return
+
+        if COMMIT_PATTERN.match(line):
+            # The final commit of a stage, not a layer of a step
+            self.step = None
+            return
+
+        if 'Cache pulled from remote' in line:
+            self.remote_cache_hits += 1
+
+        if self.step in (None, 'FROM') or self.step_counted:
+            return
+
+        if line.startswith('--> Using cache'):
+            self.cached_layers += 1
+            self.step_counted = True
+        elif LAYER_PATTERN.match(line):
+            self.built_layers += 1
+            self.step_counted = True
+
+    def observe_push_output(self, line):
+        blob = BLOB_PATTERN.search(line)
+        if not blob:
+            return
+        if 'skipped' in blob.group(2):
+            self.skipped_blobs.add(blob.group(1))
+        else:
+            self.copied_blobs.add(blob.group(1))
+
+    def set_layers(self, manifest):
+        """Layer sizes from the local manifest of the built image."""
+        self.layers = {
+            layer['digest'].split(':')[-1]: layer.get('size', 0)
+            for layer in manifest.get('layers', [])
+        }
+
+    @property
+    def pushed_bytes(self):
+        def matches(digest, prefixes):
+            return any(digest.startswith(prefix) for prefix in prefixes)
+
+        return sum(
+            size for digest, size in self.layers.items()
+            if matches(digest, self.copied_blobs) and not matches(digest, self.skipped_blobs)
+        )
+
+    def to_dict(self):
+        layers = self.cached_layers + self.built_layers
+        return {
+            'image_tag': self.image_tag,
+            'status': self.status,
+            'phases': self.phases,
+            'cached_layers': self.cached_layers,
+            'built_layers': self.built_layers,
+            'cache_hit_ratio': round(self.cached_layers / layers, 3) if layers else None,
+            'remote_cache_hits': self.remote_cache_hits,
+            'pushed_bytes': self.pushed_bytes,
+            'image_size': sum(self.layers.values()),
+            'build_site': self.build_site,
+        }
+
+    def log(self):
+        record = self.to_dict()
+        phases = ', '.join(f"{name} {seconds}s" for name, seconds in record['phases'].items())
+        print(
+            f"Build {record['status']}: {phases}. "
+            f"Layers: {record['cached_layers']} cached, {record['built_layers']} rebuilt. "
+            f"Pushed {record['pushed_bytes']} bytes, image size {record['image_size']} bytes.",
+            flush=True
+        )
+        print(f"{BUILD_REPORT_PREFIX}{json.dumps(record)}", flush=True)
+
+
+def parse_build_report(line):
+    """The record of a BuildReport log line, None for other lines."""
+    _, prefix, payload = line.partition(BUILD_REPORT_PREFIX)
+    if not prefix:
+        return None
+    try:
+        return json.loads(payload)
+    except ValueError:
+        return None
@@ -0,0 +1,263 @@
+import os
+import json
+import time
+import uuid
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from kubernetes.dynamic.exceptions import NotFoundError, ConflictError
+
+from acc_worker.configs.Environment import get_environment_variables
+from acc_worker.log_context import ContextThread
+
+env = get_environment_variables()
+
+# Lower runs first
+BUILD_PRIORITY_INTERACTIVE = 0
+BUILD_PRIORITY_PREBUILD = 1
+
+
+def _empty_state():
+    return {'waiting': {}, 'running': {}}
+
+
+class KubernetesBuildQueueStore:
+    """Queue state as json in a ConfigMap, updated with optimistic
+    concurrency and watched for changes. Transitions that leave the state
+    as it was are not written, so they do not wake other builds."""
+
+    def __init__(self, api_cli, name='wkube-build-queue'):
+        self.api_cli = api_cli
+        self.config_maps = api_cli.resources.get(api_version='v1', kind='ConfigMap')
+        self.name = name
+        self.resource_version = None
+
+    def update(self, transition):
+        """Apply `transition(state)` and return its result."""
+        while True:
+            try:
+                config_map = self.config_maps.get(name=self.name, namespace=env.WKUBE_K8_NAMESPACE)
+            except NotFoundError:
+                try:
+                    self.config_maps.create(
+                        namespace=env.WKUBE_K8_NAMESPACE,
+                        body={
+                            "apiVersion": "v1",
+                            "kind": "ConfigMap",
+                            "metadata": {"name": self.name},
+                            "data": {"state": json.dumps(_empty_state())}
+                        }
+                    )
+                except ConflictError:
+                    pass
+                continue
+
+            body = config_map.to_dict()
+            state = json.loads((body.get('data') or {}).get('state') or '{}') or _empty_state()
+            before = json.dumps(state, sort_keys=True)
+
+            result = transition(state)
+
+            if json.dumps(state, sort_keys=True) == before:
+                # Watch for changes made after what was seen here
+                self.resource_version = config_map.metadata.resourceVersion
+                return result
+
+            body['data'] = {'state': json.dumps(state)}
+            try:
+                updated = self.config_maps.replace(namespace=env.WKUBE_K8_NAMESPACE, body=body)
+            except ConflictError:
+                continue
+
+            self.resource_version = updated.metadata.resourceVersion
+            return result
+
+    def wait_for_change(self, timeout):
+        try:
+            for _ in self.api_cli.watch(
+                self.config_maps,
+                namespace=env.WKUBE_K8_NAMESPACE,
+                name=self.name,
+                resource_version=self.resource_version,
+                timeout=max(int(timeout), 1)
+            ):
+                return
+        except Exception as err:
+            # e.g. an outdated resource version, the caller checks again anyway
+            print(f"Build queue watch ended: {err}")
+
+
+class LocalBuildQueueStore:
+    """In-process stand-in for KubernetesBuildQueueStore."""
+
+    def __init__(self):
+        self.state = _empty_state()
+        self.changed = threading.Condition()
+
+    def update(self, transition):
+        with self.changed:
+            before = json.dumps(self.state, sort_keys=True)
+            result = transition(self.state)
+            if json.dumps(self.state, sort_keys=True) != before:
+                self.changed.notify_all()
+            return result
+
+    def wait_for_change(self, timeout):
+        with self.changed:
+            self.changed.wait(timeout)
+
+
+class BuildScheduler:
+    """Start builder Jobs in priority order within a global and a per-user
+    concurrency limit.
+
+    The state is written only when a build is enqueued, admitted, renewed
+    or removed. Waiting and running builds renew their queue entry every
+    `stale_after / 3` seconds. Entries not renewed within `stale_after`
+    seconds are dropped, so builds of killed workers give their slot back.
+    """
+
+    def __init__(
+        self,
+        store,
+        max_concurrent=env.BUILD_MAX_CONCURRENT,
+        max_per_user=env.BUILD_MAX_CONCURRENT_PER_USER,
+        stale_after=env.BUILD_QUEUE_STALE_AFTER
+    ):
+        self.store = store
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.stale_after = stale_after
+
+    def _prune(self, state, now):
+        for section in ('waiting', 'running'):
+            state[section] = {
+                ticket_id: ticket for ticket_id, ticket in state[section].items()
+                if ticket['renewed_at'] + self.stale_after >= now
+            }
+
+    @staticmethod
+    def _waiting_in_order(state):
+        return sorted(
+            state['waiting'].values(),
+            key=lambda ticket: (ticket['priority'], ticket['enqueued_at'])
+        )
+
+    def _admissible(self, state):
+        running = list(state['running'].values())
+        total = len(running)
+        per_user = Counter(ticket['user'] for ticket in running)
+
+        admissible = set()
+        for ticket in self._waiting_in_order(state):
+            if total >= self.max_concurrent:
+                break
+            # A user at their limit does not hold back builds of others
+            if per_user[ticket['user']] >= self.max_per_user:
+                continue
+            admissible.add(ticket['id'])
+            total += 1
+            per_user[ticket['user']] += 1
+
+        return admissible
+
+    def _try_admit(self, ticket):
+        def transition(state):
+            now = time.time()
+            self._prune(state, now)
+
+            if ticket['id'] in state['running']:
+                return 0, len(state['waiting'])
+            if ticket['id'] not in state['waiting']:
+                state['waiting'][ticket['id']] = dict(ticket, renewed_at=now)
+
+            if ticket['id'] in self._admissible(state):
+                state['running'][ticket['id']] = state['waiting'].pop(ticket['id'])
+                return 0, len(state['waiting'])
+
+            order = [item['id'] for item in self._waiting_in_order(state)]
+            return order.index(ticket['id']) + 1, len(order)
+
+        return self.store.update(transition)
+
+    def _renew(self, ticket):
+        def transition(state):
+            # A removed or pruned entry stays removed
+            for section in ('waiting', 'running'):
+                if ticket['id'] in state[section]:
+                    state[section][ticket['id']]['renewed_at'] = time.time()
+
+        self.store.update(transition)
+
+    def _remove(self, ticket):
+        def transition(state):
+            state['waiting'].pop(ticket['id'], None)
+            state['running'].pop(ticket['id'], None)
+
+        self.store.update(transition)
+
+    @contextmanager
+    def slot(self, user_id, priority=BUILD_PRIORITY_INTERACTIVE, raise_if_revoked=None):
+        ticket = {
+            'id': uuid.uuid4().hex,
+            'user': str(user_id or ''),
+            'priority': priority,
+            'enqueued_at': time.time(),
+            'renewed_at': time.time(),
+        }
+
+        stop_renewing = threading.Event()
+
+        def renew():
+            while not stop_renewing.wait(self.stale_after / 3):
+                try:
+                    self._renew(ticket)
+                except Exception as err:
+                    print(f"Could not renew build queue entry: {err}")
+
+        renew_thread = ContextThread(target=renew, daemon=True)
+        renew_thread.start()
+
+        try:
+            last_position = None
+            while True:
+                position, waiting = self._try_admit(ticket)
+                if position == 0:
+                    break
+
+                if position != last_position:
+                    print(f"Build queued at position {position} of {waiting}.")
+                    last_position = position
+
+                if raise_if_revoked:
+                    raise_if_revoked()
+                self.store.wait_for_change(timeout=self.stale_after / 3)
+
+            if last_position is not None:
+                print("Build left the queue and starts now.")
+
+            yield
+        finally:
+            stop_renewing.set()
+            renew_thread.join()
+            self._remove(ticket)
+
+
+_local_build_scheduler = None
+_local_build_scheduler_pid = None
+_local_build_scheduler_lock = threading.Lock()
+
+
+def get_build_scheduler(api_cli):
+    """Shares the queue of the cluster unless BUILD_COORDINATION is 'local'."""
+    global _local_build_scheduler, _local_build_scheduler_pid
+
+    if env.BUILD_COORDINATION != 'local':
+        return BuildScheduler(KubernetesBuildQueueStore(api_cli))
+
+    with _local_build_scheduler_lock:
+        if _local_build_scheduler_pid != os.getpid():
+            _local_build_scheduler = BuildScheduler(LocalBuildQueueStore())
+            _local_build_scheduler_pid = os.getpid()
+        return _local_build_scheduler
@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import fcntl
+import shutil
+import threading
+from contextlib import contextmanager
+
+from acc_worker.configs.Environment import get_environment_variables
+
+env = get_environment_variables()
+
+BUILD_SITE_ROOT = "image_building_site"
+
+# Mount point of the "build-site" folder of a warm builder store
+WARM_BUILD_SITE_PATH = "/home/ubuntu/.cache/acc-build-site"
+
+INDEX_FILENAME = ".acc_site_index.json"
+
+SWEPT_FILENAME = ".acc_site_swept"
+
+
+def get_build_site_root():
+    """Build folders outlive the builder pod only on a warm store."""
+    if os.environ.get('BUILDER_WARM_STORAGE'):
+        return WARM_BUILD_SITE_PATH
+    return BUILD_SITE_ROOT
+
+
+def _directory_size(path):
+    total = 0
+    for folder, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(folder, filename)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class BuildSiteJanitor:
+    """Keeps the build folders under `root` within `max_size` bytes and
+    `max_age` seconds.
+
+    Builds register their folder when they create it and remove it when they
+    finish, both without scanning `root`. After the push, builds call
+    `sweep_if_due`, which sweeps `root` when the last sweep is more than
+    `interval` seconds ago: the sweep picks up folders left behind by killed
+    builder pods, measures sizes, removes folders older than `max_age`, then
+    the oldest ones until the total fits into `max_size`. Folders younger
+    than BUILD_TIMEOUT may belong to a running build and are only removed
+    by age.
+
+    Builds run in builder pods, so only a root on a warm store, which the
+    next build on that store sees again, has leftovers to sweep.
+    """
+
+    def __init__(
+        self,
+        root=None,
+        max_size=env.BUILD_SITE_MAX_SIZE,
+        max_age=env.BUILD_SITE_MAX_AGE,
+        interval=env.BUILD_SITE_JANITOR_INTERVAL
+    ):
+        self.root = root or get_build_site_root()
+        self.max_size = max_size
+        self.max_age = max_age
+        self.interval = interval
+        self.index_path = os.path.join(self.root, INDEX_FILENAME)
+        self.swept_path = os.path.join(self.root, SWEPT_FILENAME)
+
+    @contextmanager
+    def _index(self):
+        """The index of build folders, locked and written back on exit."""
+        os.makedirs(self.root, exist_ok=True)
+        with open(f"{self.index_path}.lock", 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                try:
+                    with open(self.index_path) as index_file:
+                        index = json.load(index_file)
+                except (OSError, ValueError):
+                    index = {}
+
+                yield index
+
+                with open(f"{self.index_path}.tmp", 'w') as index_file:
+                    json.dump(index, index_file)
+                os.replace(f"{self.index_path}.tmp", self.index_path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _name(self, path):
+        return os.path.relpath(path, self.root).split(os.sep)[0]
+
+    def register(self, path):
+        with self._index() as index:
+            index[self._name(path)] = {'created_at': time.time(), 'size': 0}
+
+    def release(self, path):
+        shutil.rmtree(path, ignore_errors=True)
+        with self._index() as index:
+            index.pop(self._name(path), None)
+
+    def _evict(self, index, name, reason):
+        shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+        index.pop(name, None)
+        print(f"Deleted build folder {name} ({reason}).", flush=True)
+
+    def sweep(self):
+        now = time.time()
+
+        with self._index() as index:
+            names = {
+                name for name in os.listdir(self.root)
+                if os.path.isdir(os.path.join(self.root, name))
+            }
+
+            for name in list(index):
+                if name not in names:
+                    index.pop(name)
+            for name in names - set(index):
+                index[name] = {'created_at': os.path.getmtime(os.path.join(self.root, name)), 'size': 0}
+
+            for name in sorted(index, key=lambda name: index[name]['created_at']):
+                if index[name]['created_at'] + self.max_age < now:
+                    self._evict(index, name, 'expired')
+                else:
+                    index[name]['size'] = _directory_size(os.path.join(self.root, name))
+
+            total = sum(entry['size'] for entry in index.values())
+            for name in sorted(index, key=lambda name: index[name]['created_at']):
+                if total <= self.max_size:
+                    break
+                if index[name]['created_at'] + env.BUILD_TIMEOUT >= now:
+                    continue
+                total -= index[name]['size']
+                self._evict(index, name, 'over size limit')
+
+        usage = self.usage()
+        print(f"Build site usage: {usage['bytes']} bytes in {usage['folders']} folders.", flush=True)
+        return usage
+
+    def usage(self):
+        """Disk usage as of the last sweep."""
+        try:
+            with open(self.index_path) as index_file:
+                index = json.load(index_file)
+        except (OSError, ValueError):
+            index = {}
+
+        return {
+            'bytes': sum(entry['size'] for entry in index.values()),
+            'max_bytes': self.max_size,
+            'folders': len(index),
+            'oldest_created_at': min((entry['created_at'] for entry in index.values()), default=None),
+        }
+
+    def sweep_if_due(self):
+        try:
+            if time.time() - os.path.getmtime(self.swept_path) < self.interval:
+                return
+        except OSError:
+            pass
+
+        try:
+            self.sweep()
+        except Exception as err:
+            print(f"Build site sweep failed: {err}", flush=True)
+            return
+
+        with open(self.swept_path, 'w'):
+            pass
+
+
+_build_site_janitor = None
+_build_site_janitor_pid = None
+_build_site_janitor_lock = threading.Lock()
+
+
+def get_build_site_janitor():
+    global _build_site_janitor, _build_site_janitor_pid
+
+    with _build_site_janitor_lock:
+        if _build_site_janitor_pid != os.getpid():
+            _build_site_janitor = BuildSiteJanitor()
+            _build_site_janitor_pid = os.getpid()
+        return _build_site_janitor
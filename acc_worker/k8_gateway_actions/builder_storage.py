@@ -0,0 +1,290 @@
+import os
+import json
+import time
+import uuid
+import socket
+import subprocess
+from datetime import datetime, timezone
+from contextlib import contextmanager
+
+from kubernetes.dynamic.exceptions import NotFoundError, ConflictError
+
+from acc_worker.configs.Environment import get_environment_variables
+from acc_worker.k8_gateway_actions.build_coordination import KubernetesBuildLease
+
+env = get_environment_variables()
+
+CONTAINER_STORAGE_PATH = "/home/ubuntu/.local/share/containers/storage"
+
+USAGE_INDEX_FILENAME = "acc_image_usage.json"
+
+# Marks the last `du` of a warm store
+SIZE_CHECK_FILENAME = "acc_size_checked"
+
+# The builder Job using a warm store
+BUILDER_JOB_ANNOTATION = 'accelerator/builder-job'
+
+# Label of builder Jobs naming the warm store they mount
+BUILDER_STORAGE_LABEL = 'accelerator/builder-storage'
+
+
+class BuilderStoragePool:
+    """Persistent buildah stores shared by builder Jobs, one build at a time.
+
+    The pool has BUILDER_WARM_POOL_SIZE PVCs named builder-storage-<n>. A
+    build holds the lease of the same name while its builder Job uses the
+    PVC, so base images and the layer cache survive from one build to the
+    next without two builds writing into one store.
+
+    The lease names the builder Job. The dispatching worker renews it, so
+    it expires when that worker dies while the Job may still be writing. An
+    expired lease is therefore only taken over once its Job has finished or
+    is gone. Builder Jobs are also labelled with their store, and a store
+    whose lease was released is only used once no unfinished Job mounts it.
+    """
+
+    def __init__(self, api_cli, size=env.BUILDER_WARM_POOL_SIZE):
+        self.api_cli = api_cli
+        self.size = size
+        self.pvcs = api_cli.resources.get(api_version='v1', kind='PersistentVolumeClaim')
+        self.jobs = api_cli.resources.get(api_version='batch/v1', kind='Job')
+
+    def is_unused(self, lease):
+        """Whether the builder Job named by an expired lease stopped."""
+        job_name = (lease.metadata.annotations or {}).get(BUILDER_JOB_ANNOTATION)
+        if not job_name:
+            return True
+
+        try:
+            job = self.jobs.get(name=job_name, namespace=env.WKUBE_K8_NAMESPACE)
+        except NotFoundError:
+            return True
+
+        if job.status.succeeded or job.status.failed:
+            return True
+        print(f"Builder Job {job_name} still uses {lease.metadata.name}.")
+        return False
+
+    def busy_jobs(self, name):
+        """Builder Jobs mounting store `name` that may still write to it."""
+        jobs = self.jobs.get(
+            namespace=env.WKUBE_K8_NAMESPACE,
+            label_selector=f"{BUILDER_STORAGE_LABEL}={name}"
+        ).items
+        return [
+            job.metadata.name for job in jobs
+            if job.metadata.deletionTimestamp or not (job.status.succeeded or job.status.failed)
+        ]
+
+    def stop_job(self, job_name, timeout=300, poll_interval=5):
+        """Delete builder Job `job_name` and wait until its pod is gone, so
+        the store can be handed to the next build."""
+        try:
+            self.jobs.delete(
+                name=job_name,
+                namespace=env.WKUBE_K8_NAMESPACE,
+                body={
+                    "apiVersion": "v1",
+                    "kind": "DeleteOptions",
+                    # The Job stays until its pods are deleted
+                    "propagationPolicy": "Foreground"
+                }
+            )
+        except NotFoundError:
+            return
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                self.jobs.get(name=job_name, namespace=env.WKUBE_K8_NAMESPACE)
+            except NotFoundError:
+                print(f"Deleted builder Job {job_name}.")
+                return
+            time.sleep(poll_interval)
+
+        print(f"Builder Job {job_name} is still being deleted, its store stays blocked until it is gone.")
+
+    def ensure_pvc(self, name):
+        try:
+            self.pvcs.get(name=name, namespace=env.WKUBE_K8_NAMESPACE)
+            return
+        except NotFoundError:
+            pass
+
+        try:
+            self.pvcs.create(
+                namespace=env.WKUBE_K8_NAMESPACE,
+                body={
+                    "apiVersion": "v1",
+                    "kind": "PersistentVolumeClaim",
+                    "metadata": {
+                        "name": name,
+                        "labels": {"app": "wkube-builder-storage"}
+                    },
+                    "spec": {
+                        "storageClassName": env.WKUBE_WORKFLOW_STORAGE_CLASS,
+                        "accessModes": ["ReadWriteOnce"],
+                        "resources": {
+                            "requests": {
+                                "storage": env.BUILDER_STORAGE_SIZE
+                            }
+                        }
+                    }
+                }
+            )
+            print(f"Created builder storage PVC {name}.")
+        except ConflictError:
+            pass
+
+    @contextmanager
+    def claim(self, job_name, raise_if_revoked=None, poll_interval=5):
+        """Yield the name of a free storage PVC for builder Job `job_name`,
+        locked until exit."""
+        holder = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        last_message = None
+
+        while True:
+            for index in range(self.size):
+                name = f"builder-storage-{index}"
+                lease = KubernetesBuildLease(
+                    self.api_cli, name, holder, annotations={BUILDER_JOB_ANNOTATION: job_name}
+                )
+
+                if not lease.try_acquire(may_take_over=self.is_unused):
+                    continue
+
+                busy = self.busy_jobs(name)
+                if busy:
+                    print(f"Builder Job {busy[0]} still uses {name}.")
+                    lease.release('released')
+                    continue
+
+                lease.keep_renewed()
+                try:
+                    self.ensure_pvc(name)
+                    print(f"Building with warm storage {name}.")
+                    yield name
+                finally:
+                    lease.release('released')
+                return
+
+            message = "All warm builder storages are in use. Waiting..."
+            if message != last_message:
+                print(message)
+                last_message = message
+
+            if raise_if_revoked:
+                raise_if_revoked()
+            time.sleep(poll_interval)
+
+
+def _storage_size(storage_path, check_interval=env.BUILDER_STORAGE_SIZE_CHECK_INTERVAL):
+    """Size of the store, measured at most every `check_interval` seconds
+    as `du` over a large store takes long. 0 when not measured."""
+    marker_path = os.path.join(storage_path, SIZE_CHECK_FILENAME)
+    try:
+        if os.path.getmtime(marker_path) + check_interval > time.time():
+            return 0
+    except OSError:
+        pass
+
+    try:
+        with open(marker_path, 'w'):
+            pass
+    except OSError:
+        return 0
+
+    process = subprocess.run(["sudo", "du", "-sb", storage_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if process.returncode != 0:
+        return 0
+    return int(process.stdout.split()[0])
+
+
+def _list_images():
+    process = subprocess.run(["sudo", "buildah", "images", "--all", "--json"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if process.returncode != 0 or not process.stdout.strip():
+        return []
+    return json.loads(process.stdout)
+
+
+def _created_at(image):
+    created = image.get('createdatraw') or image.get('createdat') or ''
+    try:
+        moment = datetime.strptime(created[:19], '%Y-%m-%dT%H:%M:%S').replace(tzinfo=timezone.utc)
+        return moment.timestamp()
+    except ValueError:
+        return time.time()
+
+
+def _base_images(dockerfile_path):
+    """Image names in FROM lines, without references to earlier stages."""
+    bases, stages = [], set()
+    with open(dockerfile_path) as dockerfile:
+        for line in dockerfile:
+            parts = [part for part in line.split() if not part.startswith('--')]
+            if len(parts) < 2 or parts[0].upper() != 'FROM':
+                continue
+            if parts[1].lower() not in stages:
+                bases.append(parts[1] if ':' in parts[1].rsplit('/', 1)[-1] else f"{parts[1]}:latest")
+            if len(parts) >= 4 and parts[2].upper() == 'AS':
+                stages.add(parts[3].lower())
+    return bases
+
+
+def evict_container_storage(
+    dockerfile_path,
+    storage_path=CONTAINER_STORAGE_PATH,
+    max_size=env.BUILDER_STORAGE_MAX_SIZE,
+    max_age=env.BUILDER_STORAGE_MAX_AGE
+):
+    """Keep a warm store within `max_size` bytes and `max_age` seconds.
+
+    Base images count as used whenever a build starts from them, other
+    images (e.g. cached layers) by their creation time. Images unused for
+    `max_age` are removed. When the periodic size check finds the store
+    above `max_size`, the least recently used half of the rest goes too.
+    """
+    index_path = os.path.join(storage_path, USAGE_INDEX_FILENAME)
+    try:
+        with open(index_path) as index_file:
+            last_used = json.load(index_file)
+    except (OSError, ValueError):
+        last_used = {}
+
+    images = _list_images()
+    now = time.time()
+
+    bases = _base_images(dockerfile_path)
+    for image in images:
+        names = image.get('names') or []
+        if any(name == base or name.endswith(f"/{base}") for name in names for base in bases):
+            last_used[image['id']] = now
+
+    by_age = sorted(
+        images,
+        key=lambda image: max(last_used.get(image['id'], 0), _created_at(image))
+    )
+
+    evicted = []
+    for image in by_age:
+        if max(last_used.get(image['id'], 0), _created_at(image)) + max_age < now:
+            evicted.append(image)
+
+    remaining = [image for image in by_age if image not in evicted]
+    if _storage_size(storage_path) > max_size:
+        # Without per-image sizes drop the older half of what is left
+        evicted.extend(remaining[:max(len(remaining) // 2, 1)])
+
+    for image in evicted:
+        subprocess.run(["sudo", "buildah", "rmi", "--force", image['id']], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        last_used.pop(image['id'], None)
+
+    if evicted:
+        print(f"Evicted {len(evicted)} images from the builder storage.", flush=True)
+
+    known_ids = {image['id'] for image in images}
+    try:
+        with open(index_path, 'w') as index_file:
+            json.dump({key: value for key, value in last_used.items() if key in known_ids}, index_file)
+    except OSError as err:
+        print(f"Could not write builder storage usage index: {err}", flush=True)
@@ -0,0 +1,119 @@
+import os
+import re
+import time
+import fcntl
+import shutil
+import hashlib
+import tempfile
+import subprocess
+from contextlib import contextmanager
+
+from acc_worker.configs.Environment import get_environment_variables
+
+env = get_environment_variables()
+
+GIT_MIRROR_PATH = "/home/ubuntu/.cache/acc-git-mirrors"
+
+# Build contexts get fixed timestamps so buildah can reuse cached layers
+NORMALIZED_MTIME = 1672531200  # 2023-01-01T00:00:00Z
+
+
+def _git(*args, cwd=None, extra_env=None):
+    process = subprocess.run(
+        ["git", *args],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=cwd,
+        env={**os.environ, 'GIT_TERMINAL_PROMPT': '0', **(extra_env or {})}
+    )
+    if process.returncode != 0:
+        # Never echo urls, they may carry credentials
+        raise ValueError(f"git {args[0]} failed: {re.sub(r'://[^@/]+@', '://***@', process.stderr.decode().strip())}")
+    return process.stdout.decode().strip()
+
+
+class GitMirrorCache:
+    """Bare mirrors of job repos on the builder's persistent storage.
+
+    A mirror is keyed by the repo url without credentials. Fetched refs are
+    kept under refs/mirror/, so later fetches only download the objects the
+    mirror lacks. Builds check the requested ref out of the mirror. A
+    file lock per mirror lets concurrent builds share it. Mirrors unused for
+    `max_age` seconds are removed.
+    """
+
+    def __init__(self, root=GIT_MIRROR_PATH, max_age=env.GIT_MIRROR_MAX_AGE):
+        self.root = root
+        self.max_age = max_age
+
+    @staticmethod
+    def _without_credentials(repo_url):
+        return re.sub(r'://[^@/]+@', '://', repo_url)
+
+    def mirror_path(self, repo_url):
+        key = hashlib.sha256(self._without_credentials(repo_url).encode()).hexdigest()[:24]
+        return os.path.join(self.root, f"{key}.git")
+
+    @contextmanager
+    def _locked(self, mirror_path):
+        os.makedirs(self.root, exist_ok=True)
+        with open(f"{mirror_path}.lock", 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _export(self, mirror_path, commit, destination):
+        """Check the files of `commit` out into `destination` the way a
+        clone does, without a .git folder, then normalize timestamps of
+        files like the clone path of builds does."""
+        # A throwaway index, the mirror's own is never touched
+        with tempfile.TemporaryDirectory(dir=self.root) as index_folder:
+            _git(
+                f"--git-dir={mirror_path}", f"--work-tree={destination}",
+                "checkout", "--force", commit, "--", ".",
+                extra_env={'GIT_INDEX_FILE': os.path.join(index_folder, 'index')}
+            )
+
+        for folder, _, filenames in os.walk(destination):
+            for filename in filenames:
+                path = os.path.join(folder, filename)
+                if not os.path.islink(path):
+                    os.utime(path, (NORMALIZED_MTIME, NORMALIZED_MTIME))
+
+    def checkout(self, repo_url, ref, destination):
+        """Files of `ref` of `repo_url` in `destination`."""
+        mirror_path = self.mirror_path(repo_url)
+
+        with self._locked(mirror_path):
+            if not os.path.isdir(mirror_path):
+                _git("init", "--bare", "--quiet", mirror_path)
+
+            # The url is passed on every fetch and never stored in the mirror.
+            # The fetched ref is kept, so the next fetch negotiates from it.
+            mirror_ref = f"refs/mirror/{hashlib.sha256(ref.encode()).hexdigest()[:16]}"
+            _git(f"--git-dir={mirror_path}", "fetch", "--force", "--no-tags", repo_url, f"+{ref}:{mirror_ref}")
+            commit = _git(f"--git-dir={mirror_path}", "rev-parse", f"{mirror_ref}^{{commit}}")
+
+            os.makedirs(destination, exist_ok=True)
+            self._export(mirror_path, commit, destination)
+
+            os.utime(mirror_path)
+
+        return commit
+
+    def evict(self):
+        if not os.path.isdir(self.root):
+            return
+
+        now = time.time()
+        for name in os.listdir(self.root):
+            mirror_path = os.path.join(self.root, name)
+            if not name.endswith('.git') or os.path.getmtime(mirror_path) + self.max_age >= now:
+                continue
+
+            with self._locked(mirror_path):
+                if os.path.getmtime(mirror_path) + self.max_age < now:
+                    shutil.rmtree(mirror_path, ignore_errors=True)
+                    print(f"Evicted git mirror {name}.", flush=True)
@@ -0,0 +1,106 @@
+import os
+import time
+import threading
+import subprocess
+from concurrent.futures import Future
+
+from acc_worker.configs.Environment import get_environment_variables
+
+env = get_environment_variables()
+
+
+class GitRefResolver:
+    """Resolve branch and tag names to commit hashes with `git ls-remote`.
+
+    All heads and tags of a repo are listed in one call and kept for
+    `ttl` seconds, so refs of the same repo resolve together. Concurrent
+    lookups of a repo that is being listed wait for that one call instead
+    of starting their own.
+    """
+
+    def __init__(self, ttl=env.GIT_REF_CACHE_TTL, timeout=60):
+        self.ttl = ttl
+        self.timeout = timeout
+        self.cache = {}
+        self.in_flight = {}
+        self.lock = threading.Lock()
+
+    def list_refs(self, repo_url):
+        command = ["git", "ls-remote", repo_url, "HEAD", "refs/heads/*", "refs/tags/*"]
+        process = subprocess.run(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            timeout=self.timeout,
+            env={**os.environ, 'GIT_TERMINAL_PROMPT': '0'}
+        )
+        if process.returncode != 0:
+            raise ValueError(f"Failed to list refs: {process.stderr.decode().strip()}")
+
+        refs = {}
+        for line in process.stdout.decode().splitlines():
+            commit_hash, _, ref = line.partition('\t')
+            refs[ref.strip()] = commit_hash.strip()
+        return refs
+
+    def get_refs(self, repo_url):
+        with self.lock:
+            refs, expires_at = self.cache.get(repo_url, (None, 0))
+            if refs is not None and expires_at > time.monotonic():
+                return refs
+
+            future = self.in_flight.get(repo_url)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self.in_flight[repo_url] = future
+
+        if is_owner:
+            try:
+                refs = self.list_refs(repo_url)
+                with self.lock:
+                    self.cache[repo_url] = (refs, time.monotonic() + self.ttl)
+                future.set_result(refs)
+            except Exception as err:
+                future.set_exception(err)
+            finally:
+                with self.lock:
+                    self.in_flight.pop(repo_url, None)
+
+        return future.result()
+
+    def resolve(self, repo_url, ref):
+        """Commit hash of `ref`, matched like `git ls-remote <repo> <ref>`:
+        branches before tags."""
+        refs = self.get_refs(repo_url)
+
+        for candidate in (ref, f"refs/heads/{ref}", f"refs/tags/{ref}"):
+            if candidate in refs:
+                return refs[candidate]
+
+        raise ValueError(f"Ref '{ref}' not found in {repo_url}")
+
+    def resolve_many(self, repo_url, refs):
+        """{ref: commit hash or None} from a single listing of the repo."""
+        resolved = {}
+        for ref in refs:
+            try:
+                resolved[ref] = self.resolve(repo_url, ref)
+            except ValueError:
+                resolved[ref] = None
+        return resolved
+
+
+_git_ref_resolver = None
+_git_ref_resolver_pid = None
+_git_ref_resolver_lock = threading.Lock()
+
+
+def get_git_ref_resolver():
+    global _git_ref_resolver, _git_ref_resolver_pid
+
+    with _git_ref_resolver_lock:
+        if _git_ref_resolver_pid != os.getpid():
+            _git_ref_resolver = GitRefResolver()
+            _git_ref_resolver_pid = os.getpid()
+        return _git_ref_resolver
@@ -0,0 +1,202 @@
+import io
+import os
+import re
+import zipfile
+import posixpath
+
+from acc_worker.configs.Environment import get_environment_variables
+from acc_worker.log_context import ContextThreadPoolExecutor
+from acc_worker.k8_gateway_actions.git_mirrors import NORMALIZED_MTIME
+
+env = get_environment_variables()
+
+
+class S3RangeReader(io.RawIOBase):
+    """Seekable read-only view of an S3 object backed by ranged GETs.
+
+    Reads are served from a read-ahead block of `block_size` bytes, so
+    zipfile can find the central directory at the end of an archive and
+    then read members in order without downloading the whole object.
+    """
+
+    def __init__(self, client, bucket_name, object_name, size, block_size=8 * 1024 * 1024):
+        self.client = client
+        self.bucket_name = bucket_name
+        self.object_name = object_name
+        self.size = size
+        self.block_size = block_size
+        self.position = 0
+        self.block_start = 0
+        self.block = b''
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = self.size + offset
+        return self.position
+
+    def _fetch(self, offset, length):
+        response = self.client.get_object(self.bucket_name, self.object_name, offset=offset, length=length)
+        try:
+            return response.read()
+        finally:
+            response.close()
+            response.release_conn()
+
+    def readinto(self, buffer):
+        """Fill `buffer` up to the end of the object. zipfile does not
+        retry short reads, e.g. of a header crossing the end of a block."""
+        view = memoryview(buffer).cast('B')
+        filled = 0
+
+        while filled < len(view) and self.position < self.size:
+            block_end = self.block_start + len(self.block)
+            if not (self.block_start <= self.position < block_end):
+                length = min(max(self.block_size, len(view) - filled), self.size - self.position)
+                self.block = self._fetch(self.position, length)
+                self.block_start = self.position
+                if not self.block:
+                    break
+
+            start = self.position - self.block_start
+            chunk = self.block[start:start + len(view) - filled]
+            view[filled:filled + len(chunk)] = chunk
+            filled += len(chunk)
+            self.position += len(chunk)
+
+        return filled
+
+
+class DockerIgnore:
+    """Match paths against .dockerignore rules. The last matching rule
+    wins, `!` rules re-include, and excluding a folder excludes its
+    content."""
+
+    def __init__(self, content=''):
+        self.rules = []
+        for line in content.splitlines():
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            negated = line.startswith('!')
+            pattern = posixpath.normpath(line.lstrip('!').strip().lstrip('/'))
+            self.rules.append((negated, self._compile(pattern)))
+
+    @staticmethod
+    def _compile(pattern):
+        regex = ''
+        index = 0
+        while index < len(pattern):
+            if pattern.startswith('**', index):
+                regex += '.*'
+                index += 2
+            elif pattern[index] == '*':
+                regex += '[^/]*'
+                index += 1
+            elif pattern[index] == '?':
+                regex += '[^/]'
+                index += 1
+            else:
+                regex += re.escape(pattern[index])
+                index += 1
+        return re.compile(regex)
+
+    def is_excluded(self, path):
+        path = posixpath.normpath(path.strip('/'))
+        parts = path.split('/')
+        candidates = ['/'.join(parts[:index]) for index in range(1, len(parts) + 1)]
+
+        excluded = False
+        for negated, regex in self.rules:
+            if any(regex.fullmatch(candidate) for candidate in candidates):
+                excluded = not negated
+        return excluded
+
+
+def _member_path(info, destination):
+    """Where zipfile extracts `info` to, with the same sanitizing."""
+    parts = [part for part in info.filename.split('/') if part not in ('', '.', '..')]
+    return os.path.normpath(os.path.join(destination, *parts))
+
+
+def _extract_members(reader_factory, infos, destination):
+    with zipfile.ZipFile(reader_factory()) as zip_file:
+        for info in infos:
+            target = zip_file.extract(info, destination)
+            os.utime(target, (NORMALIZED_MTIME, NORMALIZED_MTIME))
+
+
+def extract_zip_from_job_store(
+    client,
+    bucket_name,
+    object_name,
+    destination,
+    keep=(),
+    apply_dockerignore=True,
+    workers=env.JOBSTORE_ZIP_FETCH_WORKERS
+):
+    """Extract a zip in the job store into `destination` without storing
+    the archive. With `apply_dockerignore`, members excluded by the
+    archive's root .dockerignore are skipped, except for paths in `keep`
+    such as the Dockerfile. Timestamps are normalized. Returns the number
+    of extracted members.
+    """
+    size = client.stat_object(bucket_name, object_name).size
+
+    def reader_factory():
+        return S3RangeReader(client, bucket_name, object_name, size)
+
+    try:
+        zip_file = zipfile.ZipFile(reader_factory())
+    except zipfile.BadZipFile:
+        raise ValueError(f"{object_name} is not a valid zip file")
+
+    with zip_file:
+        infos = zip_file.infolist()
+        names = {info.filename for info in infos}
+        dockerignore = DockerIgnore(
+            zip_file.read('.dockerignore').decode(errors='replace')
+            if apply_dockerignore and '.dockerignore' in names else ''
+        )
+
+    # normpath drops a leading './' without touching dotted names
+    keep = {posixpath.normpath(path) for path in keep} | {'.dockerignore'}
+    selected = sorted(
+        (
+            info for info in infos
+            if posixpath.normpath(info.filename) in keep or not dockerignore.is_excluded(info.filename)
+        ),
+        key=lambda info: info.header_offset
+    )
+
+    # Contiguous groups of similar compressed size, each read front to back
+    groups = [[] for _ in range(max(min(workers, len(selected)), 1))]
+    group_size = sum(info.compress_size for info in selected) / len(groups) or 1
+    consumed = 0
+    for info in selected:
+        groups[min(int(consumed / group_size), len(groups) - 1)].append(info)
+        consumed += info.compress_size
+
+    # zipfile creates missing folders without exist_ok, workers would race
+    for info in selected:
+        path = _member_path(info, destination)
+        os.makedirs(path if info.is_dir() else os.path.dirname(path), exist_ok=True)
+
+    with ContextThreadPoolExecutor(max_workers=len(groups)) as executor:
+        for future in [executor.submit(_extract_members, reader_factory, group, destination) for group in groups]:
+            future.result()
+
+    print(f"Extracted {len(selected)} of {len(infos)} archive entries.", flush=True)
+    return len(selected)
@@ -0,0 +1,187 @@
+import os
+import re
+import time
+import base64
+import threading
+
+import urllib3
+
+from acc_worker.configs.Environment import get_environment_variables
+from acc_worker.log_context import ContextThreadPoolExecutor
+
+env = get_environment_variables()
+
+
+MANIFEST_MEDIA_TYPES = ', '.join([
+    'application/vnd.oci.image.index.v1+json',
+    'application/vnd.oci.image.manifest.v1+json',
+    'application/vnd.docker.distribution.manifest.list.v2+json',
+    'application/vnd.docker.distribution.manifest.v2+json',
+])
+
+
+def split_image_ref(image_ref):
+    """'host[:port]/name:tag' -> (host, name, tag)"""
+    host, _, name = image_ref.partition('/')
+    tag = 'latest'
+    if ':' in name.rsplit('/', 1)[-1]:
+        name, _, tag = name.rpartition(':')
+    return host, name, tag
+
+
+class RegistryClient:
+    """Check image tags with `HEAD /v2/<name>/manifests/<tag>`.
+
+    Connections are pooled per registry and bearer tokens are reused until
+    they expire. Answers are cached for `cache_ttl` seconds when the tag
+    exists and `negative_cache_ttl` seconds when it does not. Like
+    `skopeo --tls-verify=false` before, certificates are not verified and
+    registries that do not speak TLS are reached over plain http.
+    """
+
+    def __init__(
+        self,
+        username=env.IMAGE_REGISTRY_USER,
+        password=env.IMAGE_REGISTRY_PASSWORD,
+        cache_ttl=env.IMAGE_REGISTRY_TAG_CACHE_TTL,
+        negative_cache_ttl=env.IMAGE_REGISTRY_NEGATIVE_CACHE_TTL,
+        max_workers=8
+    ):
+        self.basic_auth = 'Basic ' + base64.b64encode(f"{username}:{password}".encode()).decode()
+        self.cache_ttl = cache_ttl
+        self.negative_cache_ttl = negative_cache_ttl
+        self.max_workers = max_workers
+
+        self.http_client = urllib3.PoolManager(
+            cert_reqs="CERT_NONE",
+            num_pools=8,
+            maxsize=max_workers,
+            retries=urllib3.util.Retry(total=3, backoff_factor=0.5, redirect=5),
+            timeout=urllib3.Timeout(connect=5., read=15.)
+        )
+
+        self.schemes = {}
+        self.tokens = {}
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    def _scheme(self, host):
+        with self.lock:
+            return self.schemes.get(host, 'https')
+
+    def _request(self, method, host, path, headers):
+        scheme = self._scheme(host)
+        try:
+            return self.http_client.request(method, f"{scheme}://{host}{path}", headers=headers)
+        except urllib3.exceptions.MaxRetryError as err:
+            if scheme != 'https' or not isinstance(
+                err.reason, (urllib3.exceptions.SSLError, urllib3.exceptions.ProtocolError)
+            ):
+                raise
+
+        with self.lock:
+            self.schemes[host] = 'http'
+        return self.http_client.request(method, f"http://{host}{path}", headers=headers)
+
+    def _fetch_token(self, challenge):
+        params = dict(re.findall(r'(\w+)="([^"]*)"', challenge))
+        key = (params.get('realm'), params.get('service'), params.get('scope'))
+
+        with self.lock:
+            token, expires_at = self.tokens.get(key, (None, 0))
+        if token and expires_at > time.monotonic():
+            return token
+
+        response = self.http_client.request(
+            'GET',
+            params['realm'],
+            fields={name: params[name] for name in ('service', 'scope') if name in params},
+            headers={'Authorization': self.basic_auth}
+        )
+        if response.status != 200:
+            raise ValueError(f"Registry token request failed with status {response.status}")
+
+        payload = response.json()
+        token = payload.get('token') or payload.get('access_token')
+        # Renew a little before the registry does
+        expires_at = time.monotonic() + max(int(payload.get('expires_in', 60)) - 10, 10)
+
+        with self.lock:
+            self.tokens[key] = (token, expires_at)
+        return token
+
+    def _authorization_for(self, name):
+        with self.lock:
+            for (_, _, scope), (token, expires_at) in self.tokens.items():
+                if scope == f"repository:{name}:pull" and expires_at > time.monotonic():
+                    return f"Bearer {token}"
+        return self.basic_auth
+
+    def _head_manifest(self, image_ref):
+        host, name, tag = split_image_ref(image_ref)
+        path = f"/v2/{name}/manifests/{tag}"
+        headers = {'Accept': MANIFEST_MEDIA_TYPES, 'Authorization': self._authorization_for(name)}
+
+        response = self._request('HEAD', host, path, headers)
+
+        if response.status == 401:
+            challenge = response.headers.get('WWW-Authenticate', '')
+            if challenge.lower().startswith('bearer'):
+                headers['Authorization'] = f"Bearer {self._fetch_token(challenge)}"
+                response = self._request('HEAD', host, path, headers)
+
+        if response.status == 200:
+            return True
+        if response.status == 404:
+            return False
+        raise ValueError(f"Registry answered {response.status} for {image_ref}")
+
+    def tag_exists(self, image_ref, use_cache=True):
+        now = time.monotonic()
+
+        if use_cache:
+            with self.lock:
+                exists, expires_at = self.cache.get(image_ref, (None, 0))
+            if expires_at > now:
+                return exists
+
+        try:
+            exists = self._head_manifest(image_ref)
+        except Exception as err:
+            # Same outcome as a failing `skopeo inspect`, but not cached
+            print(f"Could not check {image_ref} in registry: {err}")
+            return False
+
+        ttl = self.cache_ttl if exists else self.negative_cache_ttl
+        with self.lock:
+            self.cache[image_ref] = (exists, now + ttl)
+
+        return exists
+
+    def tags_exist(self, image_refs, use_cache=True):
+        """Check several tags concurrently. Returns {image_ref: exists}."""
+        image_refs = list(dict.fromkeys(image_refs))
+
+        with ContextThreadPoolExecutor(max_workers=min(self.max_workers, len(image_refs) or 1)) as executor:
+            results = executor.map(lambda image_ref: self.tag_exists(image_ref, use_cache), image_refs)
+            return dict(zip(image_refs, results))
+
+    def forget(self, image_ref):
+        with self.lock:
+            self.cache.pop(image_ref, None)
+
+
+_registry_client = None
+_registry_client_pid = None
+_registry_client_lock = threading.Lock()
+
+
+def get_registry_client():
+    """Per-process client. A forked pool child gets its own pools."""
+    global _registry_client, _registry_client_pid
+
+    with _registry_client_lock:
+        if _registry_client_pid != os.getpid():
+            _registry_client = RegistryClient()
+            _registry_client_pid = os.getpid()
+        return _registry_client
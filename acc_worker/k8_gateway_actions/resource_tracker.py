@@ -0,0 +1,146 @@
+import time
+import threading
+
+from celery.exceptions import TaskRevokedError, SoftTimeLimitExceeded
+from kubernetes.dynamic.exceptions import NotFoundError
+
+from acc_worker.configs.Environment import get_environment_variables
+
+env = get_environment_variables()
+
+TASK_ID_LABEL = 'acc-task-id'
+
+# Execution stage completed by creating an object, reset when it is deleted
+STAGE_ANNOTATION = 'accelerator/execution-stage'
+
+TASK_RESOURCE_KINDS = [
+    ('batch/v1', 'Job'),
+    ('v1', 'PersistentVolumeClaim'),
+]
+
+
+class ClusterResourceTracker:
+    """Kubernetes objects created by one task.
+
+    Objects are labelled with the task id and annotated with the execution
+    stage that created them, and `tear_down` deletes them again. The
+    dispatch tears down builder Jobs it did not hand over whenever building
+    fails, and everything else (user Jobs, workflow and graph PVCs) only
+    when it is revoked or times out, so a transient failure never deletes
+    a running user Job. Objects that already existed are never tracked.
+
+    `deadline` is a time.monotonic() value after which `raise_if_revoked`
+    raises SoftTimeLimitExceeded, for pools that do not enforce time limits.
+    """
+
+    def __init__(self, task_id=None, deadline=None):
+        self.task_id = task_id
+        self.deadline = deadline
+        self.resources = []
+        self.lock = threading.Lock()
+
+    @property
+    def labels(self):
+        if not self.task_id:
+            return {}
+        return {TASK_ID_LABEL: self.task_id}
+
+    @staticmethod
+    def annotations(stage=None):
+        return {STAGE_ANNOTATION: stage} if stage else {}
+
+    def track(self, api_version, kind, name, stage=None):
+        """`stage` is the execution stage that created the object, create it
+        with `annotations(stage)` too."""
+        with self.lock:
+            self.resources.append(dict(
+                api_version=api_version,
+                kind=kind,
+                name=name,
+                stage=stage
+            ))
+
+    def raise_if_revoked(self):
+        """Revokes reach a running task only in solo and thread pools, which
+        share the revoked set with the worker. Prefork children are stopped
+        with `revoke(terminate=True, signal='SIGUSR1')` instead, which raises
+        SoftTimeLimitExceeded in the task. Also stops once the job was
+        reported unhealthy.
+        """
+        from celery.worker import state
+        from acc_worker.acc_native_jobs.job_health import raise_if_job_unhealthy
+
+        raise_if_job_unhealthy()
+
+        if self.task_id and self.task_id in state.revoked:
+            raise TaskRevokedError(f"Task {self.task_id} was revoked.")
+
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise SoftTimeLimitExceeded(f"Task {self.task_id} exceeded its soft time limit.")
+
+    def is_tracked(self, kind, name):
+        with self.lock:
+            return any((resource['kind'], resource['name']) == (kind, name) for resource in self.resources)
+
+    def hand_over(self, kind, name):
+        """Stop tracking an object, e.g. a builder Job that succeeded."""
+        with self.lock:
+            self.resources = [
+                resource for resource in self.resources
+                if (resource['kind'], resource['name']) != (kind, name)
+            ]
+
+    def tear_down(self, api_cli):
+        """Delete tracked objects, newest first. Returns the deleted ones."""
+        with self.lock:
+            resources, self.resources = self.resources, []
+
+        for resource in reversed(resources):
+            delete_resource(api_cli, resource['api_version'], resource['kind'], resource['name'])
+
+        return resources
+
+
+def delete_resource(api_cli, api_version, kind, name):
+    delete_options = {
+        'apiVersion': 'v1',
+        'kind': 'DeleteOptions',
+        'propagationPolicy': 'Background'
+    }
+    try:
+        api_cli.resources.get(api_version=api_version, kind=kind).delete(
+            name=name,
+            namespace=env.WKUBE_K8_NAMESPACE,
+            body=delete_options
+        )
+        print(f"Deleted {kind} {name}.")
+    except NotFoundError:
+        pass
+
+
+def delete_task_resources(task_id, api_cli=None):
+    """Delete objects labelled with `task_id`. Used from the worker main
+    process when the process that tracked them was killed. Returns the
+    deleted ones like ClusterResourceTracker.tear_down.
+    """
+    if api_cli is None:
+        from acc_worker.k8_gateway_actions.dispatch_build_and_push import OCIImageBuilder
+        api_cli = OCIImageBuilder().get_api_cli()
+
+    deleted = []
+    for api_version, kind in TASK_RESOURCE_KINDS:
+        items = api_cli.resources.get(api_version=api_version, kind=kind).get(
+            namespace=env.WKUBE_K8_NAMESPACE,
+            label_selector=f"{TASK_ID_LABEL}={task_id}"
+        ).items
+
+        for item in items:
+            delete_resource(api_cli, api_version, kind, item.metadata.name)
+            deleted.append(dict(
+                api_version=api_version,
+                kind=kind,
+                name=item.metadata.name,
+                stage=(item.metadata.annotations or {}).get(STAGE_ANNOTATION)
+            ))
+
+    return deleted
@@ -0,0 +1,136 @@
+import io
+import sys
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+
+current_log_stream = contextvars.ContextVar('current_log_stream', default=None)
+
+_install_lock = threading.Lock()
+
+
+class ContextLogRouter(io.TextIOBase):
+    """Stand-in for sys.stdout/sys.stderr.
+
+    Writes go to the log stream of the task running in the current context,
+    or to the stream that was replaced when no task is running. Unlike
+    `redirect_stdout` this allows several tasks per process under thread or
+    gevent pools without their output mixing.
+    """
+
+    def __init__(self, fallback):
+        super().__init__()
+        self.fallback = fallback
+
+    def _target(self):
+        return current_log_stream.get() or self.fallback
+
+    def write(self, data):
+        return self._target().write(data)
+
+    def flush(self):
+        self._target().flush()
+
+    def writable(self):
+        return True
+
+    def isatty(self):
+        return False
+
+    def fileno(self):
+        return self.fallback.fileno()
+
+    @property
+    def encoding(self):
+        return getattr(self.fallback, 'encoding', 'utf-8')
+
+
+class BoundedTextBuffer(io.TextIOBase):
+    """In-memory log of at most `max_size` characters. Output beyond that
+    is counted and noted at the end instead of being kept.
+    """
+
+    def __init__(self, max_size=1024 * 1024):
+        super().__init__()
+        self.max_size = max_size
+        self.chunks = []
+        self.size = 0
+        self.dropped_size = 0
+
+    def write(self, data):
+        if self.size + len(data) <= self.max_size:
+            self.chunks.append(data)
+            self.size += len(data)
+        else:
+            self.dropped_size += len(data)
+        return len(data)
+
+    def getvalue(self):
+        value = ''.join(self.chunks)
+        if self.dropped_size:
+            value += f"\n **** {self.dropped_size} characters of log output dropped **** \n"
+        return value
+
+
+class TaskLogHandler(logging.Handler):
+    """Send log records emitted in a task context to that task's stream."""
+
+    def emit(self, record):
+        stream = current_log_stream.get()
+        if stream is None:
+            return
+        try:
+            stream.write(f"{self.format(record)}\n")
+        except Exception:
+            self.handleError(record)
+
+
+def install_log_router():
+    """Route sys.stdout, sys.stderr and the root logger by context. Idempotent."""
+    with _install_lock:
+        if not isinstance(sys.stdout, ContextLogRouter):
+            sys.stdout = ContextLogRouter(sys.stdout)
+        if not isinstance(sys.stderr, ContextLogRouter):
+            sys.stderr = ContextLogRouter(sys.stderr)
+
+        root_logger = logging.getLogger()
+        if not any(isinstance(handler, TaskLogHandler) for handler in root_logger.handlers):
+            handler = TaskLogHandler()
+            handler.setFormatter(logging.Formatter('[%(levelname)s] %(name)s: %(message)s'))
+            root_logger.addHandler(handler)
+
+
+@contextmanager
+def log_context(stream):
+    """Send output of the current context to `stream`."""
+    install_log_router()
+    token = current_log_stream.set(stream)
+    try:
+        yield stream
+    finally:
+        current_log_stream.reset(token)
+
+
+class ContextThread(threading.Thread):
+    """Thread that runs in a copy of the creator's context, so its output
+    ends up in the log of the task that started it.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._context = contextvars.copy_context()
+
+    def run(self):
+        self._context.run(super().run)
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor that runs each call in a copy of the submitter's
+    context, see ContextThread.
+    """
+
+    def submit(self, fn, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
@@ -0,0 +1,73 @@
+import os
+import threading
+from collections import OrderedDict
+
+from accli import AjobCliService
+
+from acc_worker.configs.Environment import get_environment_variables
+
+env = get_environment_variables()
+
+
+class ProjectServiceRegistry:
+    """Per-process AjobCliService clients keyed by job token and server url.
+
+    Decorators, services and background helpers of a task share one client
+    and with it its HTTP connections instead of each opening their own.
+    The least recently used clients are dropped beyond `max_size`.
+    """
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.clients = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, job_token, server_url=None):
+        key = (job_token, server_url or env.ACCELERATOR_CLI_BASE_URL)
+
+        with self.lock:
+            project_service = self.clients.get(key)
+            if project_service is not None:
+                self.clients.move_to_end(key)
+                return project_service
+
+            project_service = AjobCliService(
+                job_token,
+                server_url=key[1],
+                verify_cert=False
+            )
+            self.clients[key] = project_service
+
+            while len(self.clients) > self.max_size:
+                self.clients.popitem(last=False)
+
+            return project_service
+
+    def release(self, job_token, server_url=None):
+        key = (job_token, server_url or env.ACCELERATOR_CLI_BASE_URL)
+        with self.lock:
+            self.clients.pop(key, None)
+
+
+_registry = None
+_registry_pid = None
+_registry_lock = threading.Lock()
+
+
+def get_project_service_registry():
+    """Per-process registry. A forked pool child gets its own instance."""
+    global _registry, _registry_pid
+
+    with _registry_lock:
+        if _registry_pid != os.getpid():
+            _registry = ProjectServiceRegistry()
+            _registry_pid = os.getpid()
+        return _registry
+
+
+def get_project_service(job_token, server_url=None) -> AjobCliService:
+    return get_project_service_registry().get(job_token, server_url)
+
+
+def release_project_service(job_token, server_url=None):
+    get_project_service_registry().release(job_token, server_url)
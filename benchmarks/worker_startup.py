@@ -0,0 +1,88 @@
+"""Import time and RSS of a fresh worker child per task.
+
+Every scenario runs in its own interpreter, like a prefork pool child
+picking up its first task. 'eager' imports all task modules up front the
+way acc_worker.acc_native_jobs did before task imports were made lazy,
+so it serves as the "before" figure for the per-task "after" figures.
+
+Usage: python benchmarks/worker_startup.py [--repeat N]
+
+Requires the worker environment variables (CELERY_BROKER_URL, ...) to be
+set, as importing the package reads them.
+"""
+import sys
+import json
+import argparse
+import subprocess
+
+PACKAGE = 'acc_worker.acc_native_jobs'
+
+TASK_MODULES = {
+    'delete_pvc_task': ['acc_worker.k8_gateway_actions.periodic_tasks'],
+    'verify_csv_regional_timeseries': ['acc_worker.acc_native_jobs.validate_csv_regional_timeseries'],
+    'merge_csv_regional_timeseries': ['acc_worker.acc_native_jobs.merge_csv_regional_timeseries'],
+    'dispatch_wkube_task': ['acc_worker.k8_gateway_actions.dispatch_build_and_push'],
+}
+
+SCENARIOS = {
+    'package only': [PACKAGE],
+    **{name: [PACKAGE, *modules] for name, modules in TASK_MODULES.items()},
+    'eager': [PACKAGE, *[module for modules in TASK_MODULES.values() for module in modules]],
+}
+
+CHILD_SCRIPT = '''
+import sys, json, time, importlib
+
+def rss_kb():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+rss_before = rss_kb()
+start = time.perf_counter()
+for module in sys.argv[1:]:
+    importlib.import_module(module)
+elapsed = time.perf_counter() - start
+
+print(json.dumps({
+    'import_seconds': elapsed,
+    'rss_before_kb': rss_before,
+    'rss_after_kb': rss_kb(),
+    'heavy_modules': sorted(
+        name for name in ('pandas', 'pyarrow', 'jsonschema', 'minio', 'kubernetes')
+        if name in sys.modules
+    ),
+}))
+'''
+
+
+def measure(modules):
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD_SCRIPT, *modules],
+        capture_output=True,
+        check=True
+    ).stdout
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'scenario':<34}{'import s':>10}{'rss MiB':>10}  loaded")
+    for name, modules in SCENARIOS.items():
+        runs = [measure(modules) for _ in range(args.repeat)]
+        best = min(runs, key=lambda run: run['import_seconds'])
+        print(
+            f"{name:<34}"
+            f"{best['import_seconds']:>10.3f}"
+            f"{best['rss_after_kb'] / 1024:>10.1f}  "
+            f"{', '.join(best['heavy_modules']) or '-'}"
+        )
+
+
+if __name__ == '__main__':
+    main()
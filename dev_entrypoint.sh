@@ -1,3 +1,13 @@
 find /home/ubuntu/app -path /home/ubuntu/app/.git -prune -o -exec chown ubuntu:nonroot {} +
 
-~/.local/bin/celery -A acc_worker.acc_native_jobs worker -B --loglevel=INFO
\ No newline at end of file
+# CELERY_WORKER_PROFILES="all" or e.g. "dispatch validation" starts one worker
+# per profile of acc_worker/acc_native_jobs/celeryconfig.py WORKER_PROFILES.
+if [ -n "$CELERY_WORKER_PROFILES" ]; then
+    if [ "$CELERY_WORKER_PROFILES" = "all" ]; then
+        python3 -m acc_worker.acc_native_jobs.worker_profiles
+    else
+        python3 -m acc_worker.acc_native_jobs.worker_profiles $CELERY_WORKER_PROFILES
+    fi
+else
+    ~/.local/bin/celery -A acc_worker.acc_native_jobs worker -B --loglevel=INFO
+fi
@@ -0,0 +1,103 @@
+import json
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class RegistryStandIn:
+    """Local plain http registry answering manifest HEAD requests.
+
+    `images` maps repository names to their tags. With `token` set,
+    manifest requests need `Bearer <token>`, which `/token` hands out the
+    way registries using a token service do. Requests are counted per path
+    in `requests`.
+    """
+
+    def __init__(self, images=None, token=None):
+        self.images = {name: set(tags) for name, tags in (images or {}).items()}
+        self.token = token
+        self.requests = Counter()
+        self.lock = threading.Lock()
+
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_HEAD(self):
+                stand_in.handle_manifest(self)
+
+            def do_GET(self):
+                if self.path.startswith('/token'):
+                    stand_in.handle_token(self)
+                else:
+                    stand_in.handle_manifest(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.host = f"127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def push(self, name, tag):
+        with self.lock:
+            self.images.setdefault(name, set()).add(tag)
+
+    def ref(self, name, tag):
+        return f"{self.host}/{name}:{tag}"
+
+    def count(self, name, tag):
+        with self.lock:
+            return self.requests[f"/v2/{name}/manifests/{tag}"]
+
+    def _reply(self, handler, status, headers=None, body=b''):
+        handler.send_response(status)
+        for key, value in (headers or {}).items():
+            handler.send_header(key, value)
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        if handler.command != 'HEAD':
+            handler.wfile.write(body)
+
+    def handle_token(self, handler):
+        with self.lock:
+            self.requests['/token'] += 1
+        body = json.dumps({'token': self.token, 'expires_in': 300}).encode()
+        self._reply(handler, 200, {'Content-Type': 'application/json'}, body)
+
+    def handle_manifest(self, handler):
+        path = handler.path
+        with self.lock:
+            self.requests[path] += 1
+
+        if self.token and handler.headers.get('Authorization') != f"Bearer {self.token}":
+            name = path[len('/v2/'):].rpartition('/manifests/')[0]
+            challenge = (
+                f'Bearer realm="http://{self.host}/token",'
+                f'service="stand-in",scope="repository:{name}:pull"'
+            )
+            self._reply(handler, 401, {'WWW-Authenticate': challenge})
+            return
+
+        if not path.startswith('/v2/') or '/manifests/' not in path:
+            self._reply(handler, 404)
+            return
+
+        name, _, tag = path[len('/v2/'):].rpartition('/manifests/')
+        with self.lock:
+            exists = tag in self.images.get(name, ())
+
+        if exists:
+            self._reply(handler, 200, {
+                'Content-Type': 'application/vnd.oci.image.manifest.v1+json',
+                'Docker-Content-Digest': f"sha256:{'0' * 64}",
+            })
+        else:
+            self._reply(handler, 404)
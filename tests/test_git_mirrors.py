@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+# Read when acc_worker.configs is imported, not used by these tests
+for name in ('CELERY_BROKER_URL', 'IMAGE_REGISTRY_URL', 'IMAGE_REGISTRY_USER', 'IMAGE_REGISTRY_PASSWORD'):
+    os.environ.setdefault(name, 'test')
+
+from acc_worker.k8_gateway_actions.git_mirrors import GitMirrorCache, NORMALIZED_MTIME
+
+
+def git(*args, cwd):
+    subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=cwd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+@unittest.skipIf(shutil.which('git') is None, "git is not installed")
+class GitMirrorCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder, ignore_errors=True)
+
+        self.repo = os.path.join(self.folder, 'repo')
+        os.makedirs(os.path.join(self.repo, 'config'))
+        files = {
+            'Dockerfile': 'FROM scratch\nCOPY . /app\n',
+            'config/settings.toml': 'debug = false\n',
+            'version.txt': '$Format:%H$\n',
+            '.gitattributes': 'config/** export-ignore\nversion.txt export-subst\n',
+        }
+        for name, content in files.items():
+            with open(os.path.join(self.repo, name), 'w') as file:
+                file.write(content)
+        os.symlink('../shared/data', os.path.join(self.repo, 'data'))
+
+        git("init", "--quiet", "--initial-branch=main", cwd=self.repo)
+        git("add", "--all", cwd=self.repo)
+        git("commit", "--quiet", "-m", "initial", cwd=self.repo)
+
+        self.mirrors = GitMirrorCache(root=os.path.join(self.folder, 'mirrors'))
+        self.repo_url = f"file://{self.repo}"
+
+    def checkout(self, name):
+        destination = os.path.join(self.folder, name)
+        commit = self.mirrors.checkout(self.repo_url, 'main', destination)
+        return commit, destination
+
+    def test_matches_clone(self):
+        commit, destination = self.checkout('site')
+
+        # export-ignore and export-subst do not apply, like in a clone
+        with open(os.path.join(destination, 'config', 'settings.toml')) as file:
+            self.assertEqual(file.read(), 'debug = false\n')
+        with open(os.path.join(destination, 'version.txt')) as file:
+            self.assertEqual(file.read(), '$Format:%H$\n')
+        self.assertEqual(os.readlink(os.path.join(destination, 'data')), '../shared/data')
+        self.assertFalse(os.path.exists(os.path.join(destination, '.git')))
+
+        self.assertEqual(os.path.getmtime(os.path.join(destination, 'Dockerfile')), NORMALIZED_MTIME)
+        self.assertEqual(len(commit), 40)
+
+    def test_second_checkout_uses_mirror(self):
+        first_commit, _ = self.checkout('first')
+        second_commit, destination = self.checkout('second')
+
+        self.assertEqual(first_commit, second_commit)
+        self.assertTrue(os.path.isfile(os.path.join(destination, 'Dockerfile')))
+        # Only the mirror and its lock, no leftover index
+        mirror_name = os.path.basename(self.mirrors.mirror_path(self.repo_url))
+        self.assertEqual(sorted(os.listdir(self.mirrors.root)), [mirror_name, f"{mirror_name}.lock"])
+
+
+if __name__ == '__main__':
+    unittest.main()
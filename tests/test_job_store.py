@@ -0,0 +1,110 @@
+import io
+import os
+import shutil
+import zipfile
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+# Read when acc_worker.configs is imported, not used by these tests
+for name in ('CELERY_BROKER_URL', 'IMAGE_REGISTRY_URL', 'IMAGE_REGISTRY_USER', 'IMAGE_REGISTRY_PASSWORD'):
+    os.environ.setdefault(name, 'test')
+
+from acc_worker.k8_gateway_actions.job_store import S3RangeReader, extract_zip_from_job_store
+
+
+class FakeS3Client:
+    """Serves in-memory objects the way minio's ranged get_object does."""
+
+    def __init__(self, objects):
+        self.objects = objects
+        self.requests = 0
+
+    def stat_object(self, bucket_name, object_name):
+        return SimpleNamespace(size=len(self.objects[object_name]))
+
+    def get_object(self, bucket_name, object_name, offset=0, length=0):
+        self.requests += 1
+        data = self.objects[object_name]
+        response = io.BytesIO(data[offset:offset + length] if length else data[offset:])
+        response.release_conn = lambda: None
+        return response
+
+
+def make_zip(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for name, content in files.items():
+            zip_file.writestr(name, content)
+    return buffer.getvalue()
+
+
+class S3RangeReaderTest(unittest.TestCase):
+
+    def test_reads_cross_block_boundaries(self):
+        data = bytes(range(256)) * 40
+        client = FakeS3Client({'object': data})
+        reader = S3RangeReader(client, 'bucket', 'object', len(data), block_size=1000)
+
+        reader.seek(990)
+        self.assertEqual(reader.read(30), data[990:1020])
+        reader.seek(len(data) - 5)
+        self.assertEqual(reader.read(30), data[-5:])
+        self.assertEqual(reader.read(30), b'')
+
+    def test_zip_headers_straddling_blocks(self):
+        files = {f"data/file{index}.txt": f"content {index}\n" * (index % 7) for index in range(300)}
+        archive = make_zip(files)
+        client = FakeS3Client({'archive.zip': archive})
+
+        for block_size in (1000, 4096):
+            reader = S3RangeReader(client, 'bucket', 'archive.zip', len(archive), block_size=block_size)
+            with zipfile.ZipFile(reader) as zip_file:
+                for name, content in files.items():
+                    self.assertEqual(zip_file.read(name).decode(), content)
+
+
+class ExtractZipFromJobStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.destination = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.destination, ignore_errors=True)
+
+    def test_parallel_workers_share_folders(self):
+        # No folder entries, every worker has to create data/ itself
+        files = {f"data/sub{index % 3}/file{index}.txt": str(index) for index in range(3000)}
+        client = FakeS3Client({'archive.zip': make_zip(files)})
+
+        extracted = extract_zip_from_job_store(client, 'bucket', 'archive.zip', self.destination, workers=8)
+
+        self.assertEqual(extracted, len(files))
+        for name, content in files.items():
+            with open(os.path.join(self.destination, name)) as extracted_file:
+                self.assertEqual(extracted_file.read(), content)
+
+    def test_dockerignore_keeps_dockerfile(self):
+        files = {
+            '.dockerignore': '.devcontainer\nlogs/\n',
+            '.devcontainer/Dockerfile': 'FROM scratch\n',
+            '.devcontainer/other': 'x',
+            'logs/run.log': 'x',
+            'app.py': 'print(1)\n',
+        }
+        client = FakeS3Client({'archive.zip': make_zip(files)})
+
+        extract_zip_from_job_store(
+            client, 'bucket', 'archive.zip', self.destination,
+            keep=['./.devcontainer/Dockerfile']
+        )
+
+        extracted = sorted(
+            os.path.relpath(os.path.join(folder, filename), self.destination)
+            for folder, _, filenames in os.walk(self.destination) for filename in filenames
+        )
+        self.assertEqual(extracted, ['.devcontainer/Dockerfile', '.dockerignore', 'app.py'])
+
+
+if __name__ == '__main__':
+    unittest.main()
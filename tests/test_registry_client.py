@@ -0,0 +1,103 @@
+import os
+import time
+import unittest
+
+# Read when acc_worker.configs is imported, not used by these tests
+for name in ('CELERY_BROKER_URL', 'IMAGE_REGISTRY_URL', 'IMAGE_REGISTRY_USER', 'IMAGE_REGISTRY_PASSWORD'):
+    os.environ.setdefault(name, 'test')
+
+from acc_worker.k8_gateway_actions.registry_client import RegistryClient, split_image_ref
+from tests.registry_stand_in import RegistryStandIn
+
+
+class SplitImageRefTest(unittest.TestCase):
+
+    def test_split(self):
+        self.assertEqual(split_image_ref('registry:5000/team/app:v1'), ('registry:5000', 'team/app', 'v1'))
+        self.assertEqual(split_image_ref('registry/app'), ('registry', 'app', 'latest'))
+
+
+class RegistryClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = RegistryStandIn({'team/app': {'v1'}})
+        self.registry.__enter__()
+        self.addCleanup(self.registry.__exit__, None, None, None)
+
+        self.client = self.make_client()
+
+    def make_client(self, **kwargs):
+        client = RegistryClient(username='user', password='secret', **kwargs)
+        # The stand-in speaks plain http, skip the https attempt
+        client.schemes[self.registry.host] = 'http'
+        return client
+
+    def test_existing_tag_is_cached(self):
+        ref = self.registry.ref('team/app', 'v1')
+
+        self.assertTrue(self.client.tag_exists(ref))
+        self.assertTrue(self.client.tag_exists(ref))
+        self.assertEqual(self.registry.count('team/app', 'v1'), 1)
+
+    def test_use_cache_false_asks_registry(self):
+        ref = self.registry.ref('team/app', 'v1')
+
+        self.client.tag_exists(ref)
+        self.client.tag_exists(ref, use_cache=False)
+        self.assertEqual(self.registry.count('team/app', 'v1'), 2)
+
+    def test_missing_tag_is_cached_until_negative_ttl_expires(self):
+        client = self.make_client(cache_ttl=60, negative_cache_ttl=0.2)
+        ref = self.registry.ref('team/app', 'v2')
+
+        self.assertFalse(client.tag_exists(ref))
+        self.registry.push('team/app', 'v2')
+        self.assertFalse(client.tag_exists(ref))
+        self.assertEqual(self.registry.count('team/app', 'v2'), 1)
+
+        time.sleep(0.3)
+
+        self.assertTrue(client.tag_exists(ref))
+        self.assertEqual(self.registry.count('team/app', 'v2'), 2)
+
+    def test_forget_drops_cached_answer(self):
+        ref = self.registry.ref('team/app', 'v2')
+
+        self.assertFalse(self.client.tag_exists(ref))
+        self.registry.push('team/app', 'v2')
+        self.client.forget(ref)
+        self.assertTrue(self.client.tag_exists(ref))
+
+    def test_failed_check_is_not_cached(self):
+        ref = "127.0.0.1:9/team/app:v1"
+        client = RegistryClient(username='user', password='secret')
+        client.http_client.connection_pool_kw['retries'] = False
+
+        self.assertFalse(client.tag_exists(ref))
+        self.assertNotIn(ref, client.cache)
+
+    def test_tags_exist(self):
+        refs = [self.registry.ref('team/app', tag) for tag in ('v1', 'v2', 'v1')]
+
+        self.assertEqual(
+            self.client.tags_exist(refs),
+            {refs[0]: True, refs[1]: False}
+        )
+        self.assertEqual(self.registry.count('team/app', 'v1'), 1)
+
+    def test_bearer_token_is_reused(self):
+        registry = RegistryStandIn({'team/app': {'v1', 'v2'}}, token='abc')
+        with registry:
+            client = RegistryClient(username='user', password='secret')
+            client.schemes[registry.host] = 'http'
+
+            self.assertTrue(client.tag_exists(registry.ref('team/app', 'v1')))
+            self.assertTrue(client.tag_exists(registry.ref('team/app', 'v2')))
+
+            self.assertEqual(registry.requests['/token'], 1)
+            # The second tag is requested with the token right away
+            self.assertEqual(registry.count('team/app', 'v2'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()